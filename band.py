@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Band-limited (lag window) recurrence plots for the crpy
+	module. See crpy for details.
+
+	Often only the lags |i-j| <= lags of a (C)RP matter, e.g. 
+	for coupled signals. Only the 2*lags+1 diagonals of that
+	band are computed (one vectorised pass per diagonal) and 
+	stored, one column per diagonal. Memory and cost are 
+	O(N*lags) instead of O(N^2). Line histogrammes are read 
+	from that storage directly: diagonal lines run down its
+	columns, vertical lines along its anti-diagonals (a 
+	strided view, no copy). Lines are cut off at the edges 
+	of the band.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+
+##################################
+##  	Band RP class			##
+##################################
+
+class bandRP:
+	"""
+	The band |i-j| <= lags of a recurrence plot. Row j, 
+	column i of the RP is band[j,lags+i-j], points outside
+	the RP are zero. size is the no. of RP points inside 
+	the band, so measures are relative to the band.
+
+	band is rows lags ... lags+nRows-1 of padded, the rows
+	above and below are zeros, so every column of the RP
+	is an anti-diagonal of padded, see columns().
+	"""
+
+	def __init__(self,padded,shape,lags):
+		"""
+		Wraps an existing int8 array of (max(shape)+2*lags) x 
+		(2*lags+1), see bandDiagonals().
+		"""
+
+		self.padded = padded
+		self.band = padded[lags:lags+shape[0]]
+		self.shape = shape
+		self.lags = lags
+		self.size = int(bandLengths(shape,lags).sum())
+
+	def columns(self):
+		"""
+		Returns a read-only (nCols x 2*lags+1) view with the
+		band part of RP column i in row i, top to bottom: 
+		element t is RP[i-lags+t,i], i.e. padded[i+t,2*lags-t].
+		"""
+
+		w = self.lags
+		step, col = self.padded.strides
+
+		return as_strided(self.padded[:,2*w:],(self.shape[1],2*w+1),
+			(step,step-col),writeable=False)
+
+	def sum(self):
+		"""
+		Returns the no. of recurrent points.
+		"""
+
+		return int(self.band.sum(dtype=int64))
+
+	def toarray(self):
+		"""
+		Returns the RP as dense int8 matrix, zero outside
+		the band.
+		"""
+
+		nRows, nCols = self.shape
+		RP = zeros(self.shape,dtype=int8)
+
+		rows = arange(nRows)[:,newaxis]
+		cols = rows + arange(-self.lags,self.lags+1)[newaxis,:]
+		valid = (cols >= 0) & (cols < nCols)
+		RP[(rows+0*cols)[valid],cols[valid]] = self.band[valid]
+
+		return RP
+
+	def lineHists(self,theiler=0):
+		"""
+		Returns the histogrammes of diagonal and vertical lines
+		and the no. of recurrent points. Points closer than
+		theiler to the main diagonal are ignored.
+		"""
+
+		nRows, nCols = self.shape
+		w = self.lags
+
+		# diagonals -w ... w outside the theiler window, as
+		# column ranges of band
+		if theiler > 0:
+			ranges = [(0,int(maximum(0,w-theiler+1))),(w+theiler,2*w+1)]
+		else:
+			ranges = [(0,2*w+1)]
+
+		allPoints = sum([int(self.band[:,d0:d1].sum(dtype=int64)) for d0,d1 in ranges])
+
+		# diagonal lines: down the columns, a block of columns at a time
+		diagHist = zeros(1,dtype=int64)
+		step = int(maximum(1,TILESIZE**2 // nRows))
+		for d0,d1 in ranges:
+			for c0 in range(d0,d1,step):
+				diagHist = addHist(diagHist,runLengths(self.band[:,c0:minimum(c0+step,d1)]))
+
+		# vertical lines: along the rows of columns(), a block
+		# of RP columns at a time
+		vertHist = zeros(1,dtype=int64)
+		near = absolute(w-arange(2*w+1)) < theiler
+		columns = self.columns()
+		step = int(maximum(1,TILESIZE**2 // (2*w+1)))
+		for i0 in range(0,nCols,step):
+			block = columns[i0:i0+step] != 0
+			block[:,near] = False
+			vertHist = addHist(vertHist,rowRuns(block)[1])
+
+		return diagHist, vertHist, allPoints
+
+	def diagHist(self,theiler=0):
+		return self.lineHists(theiler)[0]
+
+	def vertHist(self,theiler=0):
+		return self.lineHists(theiler)[1]
+
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def bandLengths(shape,lags):
+	"""
+	Length of every diagonal -lags ... lags of an RP of
+	the given shape (0 for diagonals outside the RP).
+	"""
+
+	nRows, nCols = shape
+	k = arange(-lags,lags+1)
+
+	return clip(minimum(nRows,nCols-k) - maximum(0,-k),0,None)
+
+def bandDiagonals(Xemb,Yemb,eps,lags,norm='max',theiler=0):
+	"""
+	Computes the bandRP of Xemb (columns) and Yemb (rows)
+	diagonal by diagonal. For symmetric RPs only the upper
+	diagonals are computed and mirrored. Diagonals closer 
+	than theiler to the main diagonal are left out.
+	"""
+
+	nRows, nCols = len(Yemb), len(Xemb)
+	symmetric = isSymmetric(Xemb,Yemb,norm)
+
+	# zero rows above and below the band, see bandRP
+	padded = zeros( (int(maximum(nRows,nCols))+2*lags,2*lags+1), dtype=int8)
+	band = padded[lags:lags+nRows]
+
+	for k in range(0 if symmetric else -lags,lags+1):
+
+		if abs(k) < theiler: continue
+
+		# RP[j,j+k] for all j on the diagonal
+		j0, j1 = int(maximum(0,-k)), int(minimum(nRows,nCols-k))
+		if j0 >= j1: continue
+
+		rec = pairRec(Xemb[j0+k:j1+k],Yemb[j0:j1],eps,norm)
+		band[j0:j1,lags+k] = rec
+
+		# RP[j+k,j] == RP[j,j+k]
+		if symmetric and k > 0: band[j0+k:j1+k,lags-k] = rec
+
+	return bandRP(padded,(nRows,nCols),lags)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Bootstrap confidence intervals of RQA measures for the 
+	crpy module. See crpy for details.
+
+	The RP is not recomputed. Instead the lines themselves are
+	resampled: a replicate draws as many lines as the RP has
+	from its line length histogramme (with replacement), which
+	is one multinomial draw over the distinct line lengths.
+	Thousands of replicates are drawn and measured at once as
+	(replicates x lengths) count matrices.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+
+# no. of replicates drawn at once, each block has its own seed
+BOOTBLOCK = 500
+
+# the rqa columns that are bootstrapped: DET, L, ENT, LAM, TT
+BOOTMEASURES = [1,2,4,5,6]
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def bootstrapRQAMeasures(diagHist,vertHist,nBoot=1000,lMin=2,vMin=2,seed=0,nProcs=1):
+	"""
+	Returns nBoot bootstrap replicates (nBoot x 8, see crqa)
+	of the RQA measures of the line histogrammes diagHist and
+	vertHist. Only DET, L, ENT, LAM and TT are resampled, the 
+	other columns are nan.
+
+	The replicates are drawn in blocks of BOOTBLOCK, block b 
+	seeded with (seed,b), so the result only depends on seed,
+	also when the blocks run on a pool of nProcs processes.
+	"""
+
+	diag = histLines(diagHist)
+	vert = histLines(vertHist)
+
+	blocks = [(b,int(minimum(BOOTBLOCK,nBoot-b*BOOTBLOCK)))
+		for b in range((nBoot+BOOTBLOCK-1) // BOOTBLOCK)]
+
+	if nProcs <= 1:
+		return vstack([bootBlock(diag,vert,count,lMin,vMin,(seed,b)) for b,count in blocks])
+
+	# histogrammes go in shared memory, the tasks are tiny
+	from parallel import runTasks, bootTask
+	shared = {'diagLengths':diag[0],'diagCounts':diag[1],
+		'vertLengths':vert[0],'vertCounts':vert[1]}
+	tasks = [(count,lMin,vMin,(seed,b)) for b,count in blocks]
+
+	return vstack(runTasks(bootTask,tasks,shared,nProcs))
+
+def histLines(hist):
+	"""
+	Returns the distinct line lengths of a histogramme and
+	how many lines have them.
+	"""
+
+	hist = asarray(hist,dtype=int64)
+	lengths = flatnonzero(hist[1:]) + 1
+
+	return lengths, hist[lengths]
+
+def bootBlock(diag,vert,nBoot,lMin,vMin,seed):
+	"""
+	Draws and measures nBoot replicates of the lines in diag
+	and vert, (lengths, counts) pairs from histLines().
+	"""
+
+	rng = random.RandomState(seed)
+
+	rqa = zeros( (nBoot,8) ) + nan
+	rqa[:,1], rqa[:,2], rqa[:,4] = resampleLines(rng,diag[0],diag[1],nBoot,lMin)
+	rqa[:,5], rqa[:,6], _ = resampleLines(rng,vert[0],vert[1],nBoot,vMin)
+
+	return rqa
+
+def resampleLines(rng,lengths,counts,nBoot,lMin):
+	"""
+	Draws nBoot replicates of the lines (lengths/counts as in
+	histLines) and returns per replicate the share of points 
+	in lines of at least lMin, their mean length and the 
+	entropy of their lengths, i.e. DET, L and ENT (LAM, TT).
+	"""
+
+	if counts.sum() == 0: return zeros(nBoot), zeros(nBoot), zeros(nBoot)
+
+	# one multinomial draw per replicate, rows are replicates
+	C = rng.multinomial(counts.sum(),counts/float(counts.sum()),size=nBoot).astype(float64)
+
+	long = lengths >= lMin
+	allPoints = dot(C,lengths)
+	C = C[:,long]
+	nLines = C.sum(axis=1)
+	points = dot(C,lengths[long])
+
+	with errstate(divide='ignore',invalid='ignore'):
+		share = where(allPoints > 0,points/allPoints,0)
+		mean = where(nLines > 0,points/nLines,0)
+		p = C/nLines[:,newaxis]
+		ent = -where(p > 0,p*log2(p),0).sum(axis=1)
+
+	return share, mean, where(nLines > 0,ent,0)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Persistent on-disk cache for the crpy module.
+	See crpy for details.
+
+	Results are stored under a content hash of the input data
+	and all parameters, so a changed recording or parameter
+	simply gives a new key, nothing has to be invalidated. 
+	Every entry is one .npz file, written to a temporary file
+	and renamed into place, so readers never see half written
+	entries and several processes can share one directory. 
+	Reads touch the file, the least recently used entries are
+	removed once the directory grows beyond maxBytes.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from packed import *
+import hashlib
+import tempfile
+import time
+import os
+
+# bump to invalidate all existing entries
+CACHEVERSION = 1
+
+# temporary files older than this (in seconds) are left overs
+# of crashed writers
+STALETEMP = 3600
+
+##################################
+##  	Cache class				##
+##################################
+
+class rqaCache:
+	"""
+	A directory of cached arrays, see key(), get() and put().
+	crp() and crqa() use it when given one, entries are the
+	packed RPs, the line histogrammes and the rqa vectors.
+	"""
+
+	def __init__(self,directory,maxBytes=2**30):
+		"""
+		Opens (or creates) the cache in directory, holding at
+		most about maxBytes.
+		"""
+
+		self.directory = directory
+		self.maxBytes = maxBytes
+
+		try:
+			os.makedirs(directory)
+		except OSError:
+			# someone else was faster
+			if not os.path.isdir(directory): raise
+
+	def key(self,kind,arrays,params):
+		"""
+		Returns the key of an entry of the given kind for the
+		input arrays and a tuple of parameters.
+		"""
+
+		h = hashlib.sha1()
+		h.update(repr( (CACHEVERSION,kind,params) ))
+
+		for a in arrays:
+			a = ascontiguousarray(a)
+			h.update(repr( (a.dtype.str,a.shape) ))
+			h.update(a.data)
+
+		return "%s-%s" % (kind,h.hexdigest())
+
+	def path(self,key):
+		return os.path.join(self.directory,key+'.npz')
+
+	def get(self,key):
+		"""
+		Returns the arrays stored under key as dict, None if
+		there is no such entry.
+		"""
+
+		path = self.path(key)
+
+		try:
+			with open(path,'rb') as f:
+				data = load(f)
+				entry = dict( (name,data[name]) for name in data.files )
+		except (IOError,OSError):
+			return None
+
+		# mark as recently used
+		try:
+			os.utime(path,None)
+		except OSError:
+			pass
+
+		return entry
+
+	def put(self,key,**arrays):
+		"""
+		Stores the arrays under key (atomically) and evicts old
+		entries if the cache is too large.
+		"""
+
+		fd, tmp = tempfile.mkstemp(suffix='.tmp',dir=self.directory)
+
+		try:
+			with os.fdopen(fd,'wb') as f:
+				savez(f,**arrays)
+			os.rename(tmp,self.path(key))
+		except:
+			os.remove(tmp)
+			raise
+
+		self.evict()
+
+	def evict(self):
+		"""
+		Removes the least recently used entries until the
+		cache holds at most maxBytes.
+		"""
+
+		entries, total = [], 0
+		now = time.time()
+
+		for name in os.listdir(self.directory):
+			path = os.path.join(self.directory,name)
+			try:
+				st = os.stat(path)
+			except OSError:
+				continue
+
+			if name.endswith('.npz'):
+				entries.append( (st.st_mtime,st.st_size,path) )
+				total += st.st_size
+			elif name.endswith('.tmp') and now-st.st_mtime > STALETEMP:
+				removeQuietly(path)
+
+		for mtime,size,path in sorted(entries):
+			if total <= self.maxBytes: break
+			removeQuietly(path)
+			total -= size
+
+	def clear(self):
+		"""
+		Removes all entries.
+		"""
+
+		for name in os.listdir(self.directory):
+			if name.endswith('.npz'):
+				removeQuietly(os.path.join(self.directory,name))
+
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def removeQuietly(path):
+	"""
+	Removes a file, which another process may have removed
+	already.
+	"""
+
+	try:
+		os.remove(path)
+	except OSError:
+		pass
+
+def rpEntry(RP):
+	"""
+	The arrays stored for an RP: dense and packedRPs as 
+	packedRP bits, packedTriRPs as they are.
+	"""
+
+	if isinstance(RP,packedTriRP):
+		return {'bits':RP.bits,'shape':RP.shape,'tri':True}
+
+	if not isinstance(RP,packedRP): RP = packRP(RP)
+
+	return {'bits':RP.bits,'shape':RP.shape,'tri':False}
+
+def entryRP(entry,format='packed'):
+	"""
+	Rebuilds the RP from the arrays of rpEntry(), as dense
+	matrix for format='dense'.
+	"""
+
+	nRows, nCols = entry['shape']
+
+	if entry['tri']:
+		RP = packedTriRP(entry['bits'],nCols)
+	else:
+		RP = packedRP(entry['bits'],nCols)
+
+	return RP.toarray() if format == 'dense' else RP
@@ -25,24 +25,31 @@
 	Implemented Features: 		
 		Core:		
 			- crp(X, Y, dim, tau, eps, norm='max', normalise=True)
+			- oprp(X, Y, dim, tau, format='sparse')
+			- crqa(X, Y, dim, tau, eps, norm='max', normalise=True)
+			- wcrqa(X, Y, dim, tau, eps, window, step=1)
+			- bcrqa(Xs, Ys, dim, tau, eps, norm='max', normalise=True)
+			- ecrqa(X, Y, dim, tau, epss, norm='max', normalise=True)
+			- rna(X, dim, tau, eps, norm='max', theiler=1)
+			- rqaci(X, Y, dim, tau, eps, norm='max', normalise=True)
+			- rqabounds(X, Y, dim, tau, eps, norm='max', normalise=True)
+			- onlineRQA(dim, tau, eps, window).append(samples)
 		Helper: 
 			- normaliseData(X)
 			- embedData(X, dim, tau)
  			- makeDistMatrix(X, Y, dim, tau)
+ 			- getDiagLines(RP)
+ 			- getVertLines(RP)
+ 			- qualifyRP(RP, theiler=1, lMin=2, vMin=2, extras=False)
+ 			- bootstrapRQAMeasures(diagHist, vertHist, nBoot=1000)
+ 			- rqaCache(directory, maxBytes=2**30)
  		Plotting: 
  			- showDistMatrix(distMatrix)
  			- showRP(RP)
  	ToDo:
- 		Core:
-	 		- crqa(X, Y, dim, tau, eps, norm='max', normalise=True)
-			- rqaci(X, Y, dim, tau, eps, norm='max', normalise=True)
-			- rqabounds(X, Y, dim, tau, eps, norm='max', normalise=True)
 		Helper: 
 			- applyTheiler(RP)
-	 		- getVertLines(RP)
- 			- getDiagLines(RP)
  			- quantifyLineDistribution(pLines) -> should be same for diag/vert
-	 		- bootstrapRQAMeasures()
 	 	Plotting:
 	 		- plotRQAMeasures()
  		
@@ -99,18 +106,93 @@ except ImportError:
 from helper import *
 from plots import * 
 from other import *
+from packed import *
+from sparse import *
+from windowed import *
+from parallel import *
+from bootstrap import *
+from surrogates import *
+from band import *
+from cache import *
+from network import *
+import itertools
 
 
 ##################################
 ##  	Core Functions			##
 ##################################
 
-def crp(X,Y,dim,tau,eps,norm='max',normalise=True):		
+def crp(X,Y,dim,tau,eps,norm='max',normalise=True,tileSize=TILESIZE,format='dense',
+	filename=None,rr=None,theiler=0,lags=None,cache=None):		
 	"""
 	Computes a recurrence plot with the given embedding parameters,
 	threshold and norm and returns it to the caller. For the sake 
 	of memory saving no distance matrix is created. The data is embedded
-	within the function. Multi-column input not yet supported. 
+	within the function. Multi-column input (T x channels) is
+	embedded channel by channel, see embedData(). 
+	
+	norm is 'max', 'min', 'euclidean' or 'l1'. Euclidean RPs
+	are computed via matrix products and squared distances.
+	
+	The RP is computed in square tiles of tileSize x tileSize points,
+	which bounds the temporary memory. See crpLoop() for the plain 
+	column-by-column reference implementation.
+
+	With format='packed' a bit-packed packedRP is returned
+	instead, which needs 1/8 of the memory and is never
+	held as a dense matrix. format='sparse' returns a CSR
+	sparseRP found with a neighbour grid (not for norm='min'),
+	which pays off for low recurrence rates.
+
+	For RPs (empty Y) the data is embedded once and, as the
+	RP is symmetric, only the upper triangle is computed. 
+	format='packed' then returns a packedTriRP, which only
+	stores the upper triangle.
+
+	With a filename the (dense) RP is written to that .npy
+	file as numpy.memmap, tile by tile, so RPs larger than
+	the RAM can be computed. qualifyRP() reads such RPs back
+	block by block. Reopen the file later with
+	numpy.load(filename,mmap_mode='r').
+
+	Given a recurrence rate rr (e.g. 0.05) instead of eps (pass
+	eps=None), eps is chosen to give the RP that recurrence
+	rate, see rrEps(). Only the threshold search costs another 
+	2-3 passes over the distances, no N^2 memory.
+
+	With theiler > 0 the points closer than theiler to the
+	main diagonal are left out, tiles inside that band are
+	not even computed.
+
+	format='band' only computes the lag window |i-j| <= lags
+	and returns it as bandRP, an (N x 2*lags+1) array with one
+	column per diagonal. Memory and cost are O(N*lags), RQA 
+	of a bandRP is restricted to the band.
+
+	Dense and packed RPs are looked up in (and stored to)
+	cache if one is given, see rqaCache. They are stored 
+	packed.
+	"""	
+
+	useCache = cache is not None and filename is None and format in ('dense','packed')
+	if useCache:
+		key = cache.key('rp',(X,Y),(dim,tau,eps,norm,normalise,rr,theiler,format))
+		entry = cache.get(key)
+		if entry is not None: return entryRP(entry,format)
+	
+	# normalise & embed
+	Xemb,Yemb = prepareData(X,Y,dim,tau,normalise)
+
+	rp = makeRP(Xemb,Yemb,eps,norm,tileSize,format,filename,rr,theiler,lags)
+	if useCache: cache.put(key,**rpEntry(rp))
+
+	return rp
+
+def crpLoop(X,Y,dim,tau,eps,norm='max',normalise=True):
+	"""
+	Reference implementation of crp(). The RP is computed
+	one column at a time. This is slow but simple, so keep
+	it around to compare results of the tiled version.
 	"""	
 	
 	# RP/CRP switch	
@@ -135,58 +217,488 @@ def crp(X,Y,dim,tau,eps,norm='max',normalise=True):
 	#loop
 	for i in range(lenEmbData):
 		
-		
-		xDiff = abs(Xemb[i,:] - Yemb)
 		# "switch norms"
 		if norm == 'max':	
 
-			
+			xDiff = abs(Xemb[i,:] - Yemb)
 			rp[xDiff.max(axis=1) < eps,i] = 1
-			#diff = abs(Yemb) - matlib.repmat(abs(Xemb[i]),lenEmbData,1)
-			#rp[:,i] = diff.max(axis = 1) < eps
 
 		elif norm == 'min':
 
-			diff = Yemb - matlib.repmat(Xemb[i],lenEmb,1)				
+			diff = Yemb - matlib.repmat(Xemb[i],lenEmbData,1)				
 			rp[:,i] = abs(diff.min(axis = 1)) < eps
+
+		elif norm == 'l1':
+
+			rp[:,i] = abs(Xemb[i,:] - Yemb).sum(axis=1) < eps
+
+		elif norm == 'euclidean':
+
+			rp[:,i] = sqrt(((Xemb[i,:] - Yemb)**2).sum(axis=1)) < eps
 		
 		else :				
-			raise Exception,"Only maximum and minimum norm supported now"
+			raise Exception,"Only maximum, minimum, euclidean and l1 norm supported now"
 			
 	#return to caller
 	return rp
 
-def crqa(X,Y,dim,tau,eps,norm='max',theiler=1,lMin=2,vMin=2,normalise=True):
+def oprp(X,Y,dim,tau,format='sparse'):
+	"""
+	Computes an ordinal pattern recurrence plot: points are
+	recurrent if their embedded vectors have the same ordinal
+	pattern (the same rank order). Multi-column input gets one
+	pattern per channel, all have to match.
+
+	The patterns are integer codes found in one vectorised pass
+	(see ordinalCodes) and the recurrences come from grouping
+	the points by code (see codeRP), so there are no distances
+	and the cost is O(N log N) plus the no. of recurrences.
+
+	format is 'sparse' (sparseRP), 'packed' (packedRP) or
+	'dense'.
+	"""
+
+	X = asarray(X)
+	nChannels = X.shape[1] if X.ndim == 2 else 1
+
+	# patterns do not change under normalisation
+	Xemb,Yemb = prepareData(X,Y,dim,tau,False)
+
+	codesX = ordinalCodes(Xemb,nChannels)
+	codesY = codesX if Yemb is Xemb else ordinalCodes(Yemb,nChannels)
+
+	rp = codeRP(codesX,codesY)
+
+	if format == 'sparse':
+		return rp
+	elif format == 'packed':
+		return packSparse(rp)
+	elif format == 'dense':
+		return rp.toarray()
+	else:
+		raise ValueError,"Unknown RP format: %s" % format
+
+def crqa(X,Y,dim,tau,eps,norm='max',theiler=1,lMin=2,vMin=2,normalise=True,
+	method='dense',verbose=True,rr=None,lags=None,cache=None):
 	"""
 	This function computes an (C)RP from the given data
 	and quantifies it. The complexity measures a returned
 	to the caller in rqa:
 	
 		rqas[0] == RR
-		rqas[1] == DET*
+		rqas[1] == DET
 		rqas[2]	== L
 		rqas[3] == Lmax
-		rqas[4] == ENT*
-		rqas[5] == LAM*	
+		rqas[4] == ENT
+		rqas[5] == LAM	
 		rqas[6] == TT
 		rqas[7] == Vmax
 
-		* == not implemented yet
-	
-	windowing is not supported yet. 
+	method selects how the RP is handled:
+		'dense'		full RP, see crp()
+		'packed'	bit-packed RP, see crp()
+		'sparse'	sparse RP, see crp()
+		'fused'		the RP is never stored. The diagonals are
+					computed one by one from the embedded data
+					and their lines go straight into the line
+					histogrammes, so memory is O(N). For RPs
+					only the upper diagonals are computed.
+		'band'		only the lag window |i-j| <= lags, see crp().
+					The measures are those of the band.
+
+	Instead of eps a target recurrence rate rr can be given
+	(pass eps=None), see crp(). The RR is that of the whole 
+	RP, before the theiler window is applied.
+
+	Given a cache (see rqaCache) the rqa vector and the line 
+	histogrammes are looked up there first and stored after
+	being computed. The key covers the data and all parameters.
+	Of method it only knows whether the RP is restricted to a 
+	band (and lags), the other methods give the same result.
+
+	The measures are printed unless verbose is False.
+	For windowed RQA see wcrqa().
+	"""
+
+	rqa = None
+	if cache is not None:
+		key = cache.key('rqa',(X,Y),(dim,tau,eps,norm,theiler,lMin,vMin,normalise,rr,
+			bandLags(method,lags)))
+		entry = cache.get(key)
+		if entry is not None: rqa = entry['rqa']
+
+	if rqa is None:
+		diagHist,vertHist,allPoints,size = crqaHists(X,Y,dim,tau,eps,norm,theiler,
+			normalise,method,rr,lags,cache)
+		rqa = rqaMeasures(diagHist,vertHist,allPoints,size,lMin,vMin)
+		if cache is not None: cache.put(key,rqa=rqa)
+
+	if verbose:
+		print "RR\tDET\tL\tLmax\tENT\tLam\tTT\tVmax\t"
+		print "%3.4f\t%3.4f\t%3.4f\t%3.1f\t%3.4f\t%3.4f\t%3.4f\t%3.1f\t" % \
+		 	(rqa[0],rqa[1],rqa[2],rqa[3],rqa[4],rqa[5],rqa[6],rqa[7])
+
+	return rqa
+
+def crqaHists(X,Y,dim,tau,eps,norm='max',theiler=1,normalise=True,method='dense',
+	rr=None,lags=None,cache=None):
+	"""
+	The first half of crqa(): returns the histogrammes of 
+	diagonal and vertical lines, the no. of recurrent points
+	and the size of the RP.
 	"""
+
+	if cache is not None:
+		key = cache.key('hists',(X,Y),(dim,tau,eps,norm,theiler,normalise,rr,
+			bandLags(method,lags)))
+		entry = cache.get(key)
+		if entry is not None:
+			return entry['diagHist'],entry['vertHist'],entry['allPoints'][()],int(entry['size'])
 	
-	# RP/CRP switch	
-	if len(Y) == 0: Y = X
+	Xemb,Yemb = prepareData(X,Y,dim,tau,normalise)
+	hists = embeddedHists(Xemb,Yemb,eps,norm,theiler,method,rr,lags)
+
+	if cache is not None:
+		diagHist,vertHist,allPoints,size = hists
+		cache.put(key,diagHist=diagHist,vertHist=vertHist,allPoints=allPoints,size=size)
+
+	return hists
+
+def rqaci(X,Y,dim,tau,eps,norm='max',theiler=1,lMin=2,vMin=2,normalise=True,
+	nBoot=1000,alpha=0.05,seed=0,nProcs=1,method='dense'):
+	"""
+	Bootstrap confidence intervals of the RQA measures. Returns
+	rqa (see crqa) and ci, the (2 x 8) lower and upper bounds
+	of the 1-alpha intervals (percentiles of nBoot replicates).
+
+	Only DET, L, ENT, LAM and TT are bootstrapped, the other 
+	bounds are nan. The RP is computed once, the replicates
+	resample its lines, see bootstrapRQAMeasures(). The same 
+	seed gives the same intervals for any nProcs.
+	"""
+
+	diagHist,vertHist,allPoints,size = crqaHists(X,Y,dim,tau,eps,norm,theiler,
+		normalise,method)
+	rqa = rqaMeasures(diagHist,vertHist,allPoints,size,lMin,vMin)
+
+	boot = bootstrapRQAMeasures(diagHist,vertHist,nBoot,lMin,vMin,seed,nProcs)
+	ci = zeros( (2,8) ) + nan
+	ci[:,BOOTMEASURES] = percentile(boot[:,BOOTMEASURES],[50*alpha,100-50*alpha],axis=0)
+
+	return rqa, ci
+
+def rqabounds(X,Y,dim,tau,eps,norm='max',theiler=1,lMin=2,vMin=2,normalise=True,
+	nSurr=100,surrogate='iaaft',alpha=0.05,seed=0,nProcs=1,method='dense'):
+	"""
+	Surrogate test of the RQA measures. Returns rqa (see crqa)
+	of the data and bounds, the (2 x 8) alpha/2 and 1-alpha/2 
+	quantiles of the measures of nSurr surrogates of X (see
+	makeSurrogates, surrogate is 'shuffle', 'phase' or 'iaaft').
+	Measures outside the bounds are significant.
+
+	X and Y are normalised once, all surrogates keep mean and
+	variance, so they need no normalisation of their own. Y
+	(for CRPs) is embedded once. The surrogates are made and 
+	quantified in batches of SURRBATCH, on a pool of nProcs
+	processes for nProcs > 1. Same seed, same result.
+	"""
+
+	if normalise:
+		X = normaliseData(X)
+		if len(Y) > 0: Y = normaliseData(Y)
+
+	Xemb,Yemb = prepareData(X,Y,dim,tau,False)
+	diagHist,vertHist,allPoints,size = embeddedHists(Xemb,Yemb,eps,norm,theiler,method)
+	rqa = rqaMeasures(diagHist,vertHist,allPoints,size,lMin,vMin)
+
+	params = (dim,tau,eps,norm,theiler,lMin,vMin,method,surrogate,seed)
+	tasks = [(b,int(minimum(SURRBATCH,nSurr-b*SURRBATCH)),params)
+		for b in range((nSurr+SURRBATCH-1) // SURRBATCH)]
+
+	shared = {'X':X}
+	if Yemb is not Xemb: shared['Y'] = Y
+
+	surrRqa = vstack(runTasks(surrogateTask,tasks,shared,nProcs))
+	bounds = percentile(surrRqa,[50*alpha,100-50*alpha],axis=0)
+
+	return rqa, bounds
+
+def wcrqa(X,Y,dim,tau,eps,window,step=1,norm='max',theiler=1,lMin=2,vMin=2,
+	normalise=True,nProcs=1):
+	"""
+	Windowed crqa(). The RQA measures are computed for windows
+	of window embedded points, moved on by step points. Returns
+	one rqa row (see crqa) per window, row m belongs to the 
+	embedded points m*step ... m*step+window-1.
+
+	The window RP is updated incrementally (see slidingRQA),
+	so each step costs O(step*window) instead of O(window^2).
+	Normalisation is done once for the whole series.
+
+	With nProcs > 1 the windows are split into contiguous 
+	chunks that run on a pool of nProcs processes sharing
+	the (normalised) data, which every worker embeds as a
+	view. The result is the same.
+	"""
+
+	Xemb,Yemb = prepareData(X,Y,dim,tau,normalise)
+
+	nWindows = (len(Xemb)-window) // step + 1
+	if window < 1 or nWindows < 1:
+		raise ValueError,"Data not long enough for the window size"
+
+	if nProcs <= 1:
+		return slidingWindows(Xemb,Yemb,eps,window,step,0,nWindows,
+			norm,theiler,lMin,vMin)
+
+	# a few chunks per process to even out the load
+	params = (dim,tau,eps,window,step,norm,theiler,lMin,vMin)
+	tasks = [(first,count,params) for first,count in splitRange(nWindows,4*nProcs)]
+
+	# the data was normalised in-place, the embedding is a view of it
+	shared = {'X':X}
+	if Yemb is not Xemb: shared['Y'] = Y
 	
-	rp = crp(X,Y,dim,tau,eps,norm,normalise)
+	return vstack(runTasks(windowTask,tasks,shared,nProcs))
+
+def bcrqa(Xs,Ys,dim,tau,eps,norm='max',theiler=1,lMin=2,vMin=2,normalise=True,
+	method='dense',nProcs=1):
+	"""
+	Batch crqa(). Xs is a 2D array with one trial per row (3D
+	for multi-channel trials), a list or any other iterable of
+	series, Ys the matching trials for CRPs or empty for RPs.
+	Returns one rqa row (see crqa) per trial.
+
+	Consecutive trials of the same length are stacked, then
+	normalised, embedded, thresholded and measured together
+	(up to BATCHCELLS RP points per stack), so there is little
+	per-trial overhead. Trials too long to be stacked go 
+	through crqa() one by one.
+
+	With nProcs > 1 the trials are spread over a pool of nProcs
+	processes. The data is passed in shared memory, results
+	come back in the order of Xs.
+	"""
+
+	params = (dim,tau,eps,norm,theiler,lMin,vMin,normalise,method)
+	if hasattr(Ys,'__len__') and len(Ys) == 0: Ys = None
+
+	if nProcs <= 1:
+		rqa = [stackRQA(X,Y,params) for X,Y in trialStacks(Xs,Ys)]
+		return vstack(rqa) if len(rqa) else zeros( (0,8) )
+
+	Xs = [asarray(x,dtype=float64) for x in Xs]
+	if len(Xs) == 0: return zeros( (0,8) )
+
+	bounds = cumsum([0]+[len(x) for x in Xs])
+	shared = {'X':concatenate(Xs),'bounds':bounds}
+
+	if Ys is not None:
+		Ys = [asarray(y,dtype=float64) for y in Ys]
+		if [y.shape for y in Ys] != [x.shape for x in Xs]:
+			raise ValueError,"X and Y series must be of the same length"
+		shared['Y'] = concatenate(Ys)
+
+	# a few chunks of trials per process
+	tasks = [(first,count,params) for first,count in splitRange(len(Xs),4*nProcs)]
+
+	return vstack(runTasks(batchTask,tasks,shared,nProcs))
+
+def ecrqa(X,Y,dim,tau,epss,norm='max',theiler=1,lMin=2,vMin=2,normalise=True):
+	"""
+	crqa() for a whole vector of thresholds epss, e.g. to
+	choose eps. Returns one rqa row (see crqa) per eps.
+
+	The data is embedded once and the RP swept diagonal by
+	diagonal as in crqa(method='fused'). Every distance is
+	computed once and compared against all thresholds, each
+	threshold has its own line histogrammes.
+	"""
+
+	epss = asarray(epss,dtype=float64).ravel()
+
+	Xemb,Yemb = prepareData(X,Y,dim,tau,normalise)
+	if isSymmetric(Xemb,Yemb,norm):
+		diagHists,vertHists,allPoints = symmetricSweep(Xemb,epss,norm,theiler)
+	else:
+		diagHists,vertHists,allPoints = diagonalSweep(Xemb,Yemb,epss,norm,theiler)
+
+	size = len(Xemb)*len(Yemb)
+	rqa = zeros( (len(epss),8) )
+	for e in range(len(epss)):
+		rqa[e] = rqaMeasures(diagHists[e],vertHists[e],allPoints[e],size,lMin,vMin)
+
+	return rqa
+
+def rna(X,dim,tau,eps,norm='max',theiler=1,normalise=True,tileSize=TILESIZE,
+	rr=None,nSources=None,seed=0):
+	"""
+	Recurrence network analysis: the RP of X (main diagonal
+	and Theiler window removed) is taken as adjacency matrix
+	of an undirected network. Returns 
+
+		degree		no. of neighbours per node
+		clustering	local clustering coefficient per node
+		transitivity	global clustering coefficient
+		pathLength	average shortest path length
+
+	The adjacency comes from the sparse RP engine as CSR and
+	the measures work on its edge lists (see network), so
+	there are no N x N matrices and 10^5 nodes are fine for
+	low recurrence rates. norm has to be symmetric and not
+	'min'. The path length is O(N*edges), give nSources to
+	average over that many random sources instead.
+	"""
+
+	Xemb,Yemb = prepareData(X,[],dim,tau,normalise)
+
+	A = makeRP(Xemb,Yemb,eps,norm,tileSize,'sparse',rr=rr,theiler=max(theiler,1))
+
+	return networkMeasures(A,nSources,seed)
+
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def bandLags(method,lags):
+	"""
+	The lag window the RQA of method is restricted to (None
+	for the whole RP), for cache keys.
+	"""
+
+	return lags if method == 'band' else None
+
+def makeRP(Xemb,Yemb,eps,norm='max',tileSize=TILESIZE,format='dense',filename=None,
+	rr=None,theiler=0,lags=None):
+	"""
+	crp() of already embedded data.
+	"""
+
+	lenEmbData = len(Xemb)
+
+	if rr is not None: eps = rrEps(Xemb,Yemb,rr,norm,tileSize)
+
+	if filename is not None and format != 'dense':
+		raise ValueError,"Only dense RPs can be written to a file"
+
+	if format == 'packed' and isSymmetric(Xemb,Yemb,norm):
+		return packedTriTiles(Xemb,eps,norm,tileSize,theiler)
+	elif format == 'packed':
+		return packedTiles(Xemb,Yemb,eps,norm,tileSize,theiler)
+	elif format == 'sparse':
+		return sparseTiles(Xemb,Yemb,eps,norm,tileSize,theiler)
+	elif format == 'band':
+		if lags is None: raise ValueError,"Band RPs need the lag window lags"
+		return bandDiagonals(Xemb,Yemb,eps,lags,norm,theiler)
+	elif format != 'dense':
+		raise ValueError,"Unknown RP format: %s" % format
+
+	#alloc memory for CRP matrix
+	rp = allocMatrix( (lenEmbData,lenEmbData), int8, filename)
 	
-	rqa = qualifyRP(rp,theiler,lMin,vMin)
+	#loop over tiles, rows are Y and columns are X
+	fillTiles(rp,Xemb,Yemb,norm,eps,tileSize,theiler)
+	if filename is not None: rp.flush()
+			
+	#return to caller
+	return rp
+
+def embeddedHists(Xemb,Yemb,eps,norm='max',theiler=1,method='dense',rr=None,
+	lags=None):
+	"""
+	crqaHists() of already embedded data.
+	"""
+
+	if rr is not None: eps = rrEps(Xemb,Yemb,rr,norm)
+
+	if method == 'fused':
+		if isSymmetric(Xemb,Yemb,norm):
+			diagHist,vertHist,allPoints = symmetricSweep(Xemb,eps,norm,theiler)
+		else:
+			diagHist,vertHist,allPoints = diagonalSweep(Xemb,Yemb,eps,norm,theiler)
+		return diagHist,vertHist,allPoints,len(Xemb)*len(Yemb)
+
+	# the theiler window is never computed
+	rp = makeRP(Xemb,Yemb,eps,norm,format=method,theiler=theiler,lags=lags)
+	diagHist,vertHist,allPoints = rpHists(rp,theiler)
+
+	return diagHist,vertHist,allPoints,rp.size
+
+def trialStacks(Xs,Ys=None):
+	"""
+	Yields runs of trials of the same shape from Xs (and Ys,
+	None for RPs) as float64 stacks (trials x T [x channels])
+	of at most stackSize() trials, see bcrqa().
+	"""
+
+	# arrays are simply cut
+	if isinstance(Xs,ndarray) and Xs.ndim > 1 and (Ys is None or isinstance(Ys,ndarray)):
+		if Ys is not None and Ys.shape != Xs.shape:
+			raise ValueError,"X and Y series must be of the same length"
+		n = stackSize(Xs.shape[1])
+		for first in range(0,len(Xs),n):
+			yield Xs[first:first+n].astype(float64), \
+				None if Ys is None else Ys[first:first+n].astype(float64)
+		return
+
+	pairs = itertools.izip(Xs,itertools.repeat(None)) if Ys is None else itertools.izip(Xs,Ys)
+
+	Xstack, Ystack = [], []
+	for x,y in pairs:
+		x = asarray(x,dtype=float64)
+		if y is not None:
+			y = asarray(y,dtype=float64)
+			if y.shape != x.shape:
+				raise ValueError,"X and Y series must be of the same length"
+
+		if len(Xstack) and (x.shape != Xstack[0].shape or len(Xstack) == stackSize(len(x))):
+			yield array(Xstack), array(Ystack) if len(Ystack) else None
+			Xstack, Ystack = [], []
+
+		Xstack.append(x)
+		if y is not None: Ystack.append(y)
+
+	if len(Xstack):
+		yield array(Xstack), array(Ystack) if len(Ystack) else None
+
+def stackSize(T):
+	"""
+	No. of trials of length T that are measured together.
+	"""
+
+	return int(maximum(1,BATCHCELLS // (T*T)))
+
+def stackRQA(X,Y,params):
+	"""
+	The rqa rows of a stack of trials from trialStacks(),
+	params as in batchTask().
+	"""
+
+	dim, tau, eps, norm, theiler, lMin, vMin, normalise, method = params
+	nTrials, T = X.shape[:2]
+
+	# long trials one by one
+	if stackSize(T) < 2:
+		return array([crqa(X[n],[] if Y is None else Y[n],dim,tau,eps,norm,
+			theiler,lMin,vMin,normalise,method,verbose=False) for n in range(nTrials)])
+
+	if normalise:
+		X = normaliseStack(X)
+		if Y is not None: Y = normaliseStack(Y)
+
+	Xemb = embedStack(X,dim,tau)
+	Yemb = Xemb if Y is None else embedStack(Y,dim,tau)
+
+	RPs = recTile(Xemb,Yemb,eps,norm)
+	diagHists,vertHists,allPoints = stackHists(RPs,theiler)
 
-	print "RR\tDET\tL\tLmax\tENT\tLam\tTT\tVmax\t"
-	print "%3.4f\t%3.4f\t%3.4f\t%3.1f\t%3.4f\t%3.4f\t%3.4f\t%3.1f\t" % \
-	 	(rqa[0],rqa[1],rqa[2],rqa[3],rqa[4],rqa[5],rqa[6],rqa[7])
+	size = RPs.shape[1]*RPs.shape[2]
+	rqa = zeros( (nTrials,8) )
+	for n in range(nTrials):
+		rqa[n] = rqaMeasures(diagHists[n],vertHists[n],allPoints[n],size,lMin,vMin)
 
+	return rqa
 
 			
 ##################################
@@ -50,6 +50,13 @@
 
 
 """
+from numpy import *
+from helper import fillTiles, allocMatrix, normaliseData, embedData, ordinalCodes, pairRec, TILESIZE
+from sparse import codeRP
+from packed import packSparse
+
+# no. of results kept per stage, e.g. the last 2 RPs, see memo()
+MEMOSIZE = 2
 
 class crpy:
 	""" 
@@ -57,6 +64,18 @@ class crpy:
 	Therefore please import it as: from crpy import *.
 	The class provides a basic set of functions for computing
 	and displaying RPs and CRPs.
+
+	Everything is computed lazily and memoised: the normalised
+	data, the embeddings, the distance matrices and the RPs are
+	kept per parameter set and only recomputed when one of
+	the parameters they depend on changes (see memo()). After
+	makeDistMatrix(), crp() with the same dim, tau, norm and 
+	normalise only thresholds that (float32) matrix, so trying
+	several eps is cheap (not for the euclidean norm, RPs 
+	compare squared distances there). X and Y themselves are
+	never changed. The last MEMOSIZE results per stage are held
+	until forget() is called, results written to a file are
+	not memoised (the next call with that file overwrites it).
 	"""
 	
 		
@@ -79,6 +98,9 @@ class crpy:
 		self.flagIsEmbedded = False
 		self.flagIsDistMatrix = False
 		self.flagIsRP = False
+
+		# memoised results, stage -> (upstream params, [(params, result)])
+		self.stages = {}
 		
 		# assign data
 		self.X = X;
@@ -86,158 +108,202 @@ class crpy:
 		if len(Y) == 0:
 			self.Y = X
 			# normalise/embed only once
-			self.flapIsCRP = False;
+			self.flagIsCRP = False;
 
 		else: 
 			self.Y = Y
 			# normalise/embed only twice
-			self.flapIsCRP = True;			
+			self.flagIsCRP = True;			
 			if len(self.X) != len(self.Y):
 				raise Exception,"X and Y must be of the same length"	
 
+	def memo(self,stage,upstream,params,compute):
+		"""
+		Returns the result of stage for params, calling compute()
+		on first access only. upstream are the parameters of the
+		earlier stages the result depends on, when they change
+		all results of the stage are dropped. Only the MEMOSIZE
+		most recently used results are kept.
+		"""
+
+		result = self.memoised(stage,upstream,params)
+		if result is None: result = compute()
+
+		last, results = self.stages.get(stage,(None,[]))
+		if last != upstream: results = []
+
+		# most recently used last
+		results = [r for r in results if r[0] != params] + [(params,result)]
+		self.stages[stage] = (upstream,results[-MEMOSIZE:])
+
+		return result
+
+	def memoised(self,stage,upstream,params):
+		"""
+		Returns the memoised result of stage for params or None.
+		"""
+
+		last, results = self.stages.get(stage,(None,[]))
+		if last != upstream: return None
+
+		for p,result in results:
+			if p == params: return result
+
+	def forget(self):
+		"""
+		Drops all memoised results.
+		"""
+
+		self.stages = {}
 	
-	def normaliseData(self):
+	def normaliseData(self,normalise=True):
 		"""
-		Normalises X and Y to mu=0 & sigma = 1	(in-place)
+		Returns (normalised) copies of X and Y, mu=0 & sigma = 1.
+		Multi-column data is normalised per channel.
 		"""
-		
-		# mu & sigma
-		meanX = self.X.mean()
-		stdX = self.X.std()
 
-		if not self.flagIsCRP:
-		
-			self.X -= meanX;self.X /= stdX;
-			self.Y = self.X
+		def compute():
+			X = array(self.X,dtype=float64)
+			if normalise: normaliseData(X)
+			if not self.flagIsCRP: return X,X
+			Y = array(self.Y,dtype=float64)
+			if normalise: normaliseData(Y)
+			return X,Y
 
-		else:
-		
-			meanY = self.Y.mean()
-			stdY = self.Y.std()
-			
-			self.X -= meanX;self.X /= stdX
-			self.Y -= meanY;self.Y /= stdY
+		self.flagIsNormalised = normalise
 		
+		return self.memo('data',(),normalise,compute)
 
-	def embedData(self,dim,tau):
+	def embedData(self,dim,tau,normalise=True):
 		"""
 		Embeds the vectors a X and Y with given 
-		embedding dimension and delay
+		embedding dimension and delay. The embeddings
+		are read-only views on the (normalised) data,
+		see helper.embedData().
 		"""
 		
-		# data length		
-		self.lenData = len(self.X)
+		X,Y = self.normaliseData(normalise)
 
-		# consistency check 		
-		if (dim-1)*tau >= self.lenData:
-			raise ValueError,"Data not long enough for embedding parameters"		
+		def compute():
+			# only embedded once since X == Y
+			Xemb = embedData(X,dim,tau)
+			return Xemb, embedData(Y,dim,tau) if self.flagIsCRP else Xemb
 
-		self.lenEmbData = self.lenData - (dim-1)*tau		
+		self.Xemb,self.Yemb = self.memo('emb',normalise,(dim,tau),compute)
 
 		# store for later plotting/debugging
+		self.lenData = len(self.X)
 		self.dim = dim;
 		self.tau = tau;
+		self.lenEmbData = len(self.Xemb)
+		self.flagIsEmbedded = True
 
-		if not self.flapIsCRP:
-		# only embedded once since X == Y
-			
-			# alloc memory		
-			self.Xemb = zeros( (self.lenData - (dim-1)*tau, dim), dtype=float32 )
-
-			# assign values
-			for i in range(dim):
-
-				self.Xemb[:,i] = self.X[i*tau : self.lenData -( (dim-1)-i ) *tau]
-
-			self.Yemb = self.Xemb
-
-		else:
-			# alloc memory		
-			self.Xemb = zeros( (self.lenData - (dim-1)*tau, dim), dtype=float32 )
-			self.Yemb = zeros( (self.lenData - (dim-1)*tau, dim), dtype=float32 )
-
-			# assign values
-			for i in range(dim):
-
-				self.Xemb[:,i] = self.X[i*tau : self.lenData -( (dim-1)-i ) *tau]
-				self.Yemb[:,i] = self.Y[i*tau : self.lenData -( (dim-1)-i ) *tau]
+		return self.Xemb,self.Yemb
 		
-	def makeDistMatrix(self,dim,tau,norm='max',normalise=True):
+	def makeDistMatrix(self,dim,tau,norm='max',normalise=True,filename=None):
 		"""
 		Computes the chosen distance between all
 		points in X and Y and stores the matrix
-		in the class.
+		in the class. With a filename the matrix
+		is a numpy.memmap of that .npy file.
 		"""	
 
-		#normalise
-		if normalise: self.normaliseData()
-		#embed
-		self.embedData(dim,tau)
-
-		# alloc output matrix
-		self.distMatrix = empty( (self.lenEmbData,self.lenEmbData), dtype=float32)	
-
-		for i in range(self.lenEmbData):
+		Xemb,Yemb = self.embedData(dim,tau,normalise)
 
-			# "switch norms"
-			if norm == 'max':	
-			
-				diff = self.Yemb - matlib.repmat(self.Xemb[i],self.lenEmbData,1)				
-				self.distMatrix[:,i] = 	abs(diff.max(axis = 1))		
-				
-			elif norm == 'min':
-
-				diff = self.Yemb - matlib.repmat(self.Xemb[i],self.lenEmbData,1)			
-				self.distMatrix[:,i] = 	abs(diff.min(axis = 1))
-
-			else:
+		def compute():
+			# tile by tile, RPs only compute the upper triangle
+			dist = allocMatrix( (len(Yemb),len(Xemb)), float32, filename)
+			return fillTiles(dist,Xemb,Yemb,norm)
 
-				raise Exception,"Only maximum and minimum norm supported now"
+		if filename is None:
+			self.distMatrix = self.memo('dist',(normalise,dim,tau),norm,compute)
+		else:
+			self.distMatrix = compute()
+		self.norm = norm
 	
 		# for short-circuiting				
-		self.flagIsDistanceMatrix = True	
+		self.flagIsDistMatrix = True	
 
+		return self.distMatrix
 
-	def crp(self,dim,tau,eps,norm='max',normalise=True):		
+	def crp(self,dim,tau,eps,norm='max',normalise=True,filename=None):		
 		"""
 		Computes a recurrence plot with the given embedding parameters,
-		threshold and norm. 
+		threshold and norm. With a filename the RP is written to that 
+		.npy file tile by tile (numpy.memmap).
+
+		If the distance matrix of these parameters has been computed
+		(makeDistMatrix()) it is thresholded, otherwise the RP is 
+		computed from the embeddings. The RP is the same either
+		way: distances that might round to the other side of eps
+		in float32 are computed again. Euclidean RPs are always
+		computed from squared distances, as in crpy.crp().
 		"""	
-		#normalise
-		if normalise: self.normaliseData()
-		#embed
-		self.embedData(dim,tau)
-
-		#and now for the crp
-		#alloc memory for CRP matrix
-		self.rp = 	zeros( (self.lenEmbData,self.lenEmbData), dtype=int8)	
-		
-		#loop
-		for i in range(self.lenEmbData):
 
-			# "switch norms"
-			if norm == 'max':	
-			
-				diff = self.Yemb - matlib.repmat(self.Xemb[i],self.lenEmbData,1)
-				self.rp[:,i] = 	abs(diff.max(axis = 1)) < eps
-
-			elif norm == 'min':
-
-				diff = self.Yemb - matlib.repmat(self.Xemb[i],self.lenEmb,1)				
-				self.rp[:,i] = 	abs(diff.min(axis = 1)) < eps
-			
-			else :				
-				raise Exception,"Only maximum and minimum norm supported now"
+		Xemb,Yemb = self.embedData(dim,tau,normalise)
+		dist = self.memoised('dist',(normalise,dim,tau),norm)
+		if norm == 'euclidean': dist = None
+
+		def compute():
+			rp = allocMatrix( (len(Yemb),len(Xemb)), int8, filename)
+			if dist is None:
+				# tile by tile, RPs only compute the upper triangle
+				return fillTiles(rp,Xemb,Yemb,norm,eps)
+
+			# float32 distances below lo are < eps, above hi not
+			lo = nextafter(float32(eps),float32(-inf))
+			hi = nextafter(float32(eps),float32(inf))
+			for r0 in range(0,len(rp),TILESIZE):
+				block = dist[r0:r0+TILESIZE]
+				rec = block < lo
+				j,i = nonzero( (block >= lo) & (block <= hi) )
+				rec[j,i] = pairRec(Xemb[i],Yemb[r0+j],eps,norm)
+				rp[r0:r0+TILESIZE] = rec
+			return rp
+
+		if filename is None:
+			self.rp = self.memo('rp',(normalise,dim,tau,norm),eps,compute)
+		else:
+			self.rp = compute()
+		self.eps = eps
+		self.norm = norm
 				
 		# for short-circuiting		
 		self.flagIsRP = True			
 
-	def makeOPRP(self):		
+		return self.rp
+
+	def makeOPRP(self,dim,tau,format='sparse'):		
+		"""
+		Computes an ordinal pattern recurrence plot: points 
+		with the same ordinal pattern are recurrent. The RP
+		is built by grouping the points by pattern, see
+		crpy.oprp(). format is 'sparse', 'packed' or 'dense'.
+		"""
 		
-		# DO HERE
-		# symbolise timeseries
-		# match symbols for OPRP
-		pass
+		# symbolise timeseries (patterns are not changed by
+		# normalisation)
+		Xemb,Yemb = self.embedData(dim,tau,False)
+
+		def compute():
+			nChannels = self.X.shape[1] if ndim(self.X) == 2 else 1
+			codesX = ordinalCodes(Xemb,nChannels)
+			codesY = ordinalCodes(Yemb,nChannels) if self.flagIsCRP else codesX
+
+			# match symbols for OPRP
+			rp = codeRP(codesX,codesY)
+			if format == 'packed':
+				rp = packSparse(rp)
+			elif format == 'dense':
+				rp = rp.toarray()
+			return rp
+
+		self.rp = self.memo('oprp',(dim,tau),format,compute)
+
+		# for short-circuiting		
+		self.flagIsRP = True
+
+		return self.rp
 
 
 ##################################
@@ -249,13 +315,13 @@ class crpy:
 		Return distance matrix to caller.
 		"""	
 	
-		if not self.flagIsDistMarix:
+		if not self.flagIsDistMatrix:
 	
 			print "No Distance Matrix computed yet. Sorry."
 			return
 
 		else:
-			return self.DistMatrix
+			return self.distMatrix
 		
 	def getRP(self):
 		"""
@@ -266,7 +332,7 @@ class crpy:
 			print "No RP computed yet. Sorry."
 			return
 		else:
-			return self.RP
+			return self.rp
 	
 
 ##################################
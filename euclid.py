@@ -1,15 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Euclidean distances for the crpy module.
+	See crpy for details. The distance engine itself lives
+	in helper (norm='euclidean'), this is a convenience 
+	wrapper around it.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+
 def euclidDistance(point1,point2):
+	"""
+	Euclidean distance between two points. Given two
+	arrays of points (one per row) all pairwise distances
+	are returned, rows are point2 and columns point1.
+	"""
+
+	point1, point2 = asarray(point1,dtype=float64), asarray(point2,dtype=float64)
+
+	if point1.ndim == 1 and point2.ndim == 1:
+		return sqrt(((point1-point2)**2).sum())
+
+	return distTile(atleast_2d(point1),atleast_2d(point2),'euclidean')
+
 
-	dist = 0
-	for n in range(len(element1)):
-		dist = dist + pow((element1[n] - element2[n]),2)
-	#print 'dist' + dist
+if __name__ == "__main__":
 
-dim = 3;tau=3;
-X = sin(linspace(1,6*pi,20))
-Xemb = embedData(X,dim,tau)
+	dim = 3;tau=3;
+	X = sin(linspace(1,6*pi,20))
+	Xemb = embedData(X,dim,tau)
 
-for i in range(size(Xemb,0)): print Xemb[i,:];
-	distance = 0 	
-	for j in range(dim):
-	
+	print euclidDistance(Xemb,Xemb)
@@ -1,36 +1,200 @@
 """
 Euclidean distance transform
+
+Exact, in two separable passes: down the columns the distance
+to the nearest set cell is found with running indices, along
+the rows the lower envelope of parabolas is built (Felzenszwalb
+& Huttenlocher, 2012), so every pass is linear in the number of
+cells. The envelopes of a chunk of rows are built together, one
+position at a time for all of them, with numpy.
+
+Besides dense bitmaps, packedRPs and sparseRPs are read block
+by block, so the RP is never unpacked as a whole.
 """
 
 import numpy
 
-def _upscan(f):
-    for i, fi in enumerate(f):
-        if fi == numpy.inf: continue
-        for j in xrange(1,i+1):
-            x = fi+j*j
-            if f[i-j] < x: break
-            f[i-j] = x
+# no. of cells per chunk of rows in the envelope pass
+CHUNK = 2**23
+
+# no. of cells per block of rows in the column pass
+BLOCK = 2**22
 
 def distance_transform(bitmap):
-    f = numpy.where(bitmap, 0.0, numpy.inf)
-    for i in xrange(f.shape[0]):
-        _upscan(f[i,:])
-        _upscan(f[i,::-1])
-    for i in xrange(f.shape[1]):
-        _upscan(f[:,i])
-        _upscan(f[::-1,i])
-    numpy.sqrt(f,f)
+    """
+    Returns the euclidean distance of every cell to the
+    nearest nonzero cell of bitmap (inf if there is none).
+    bitmap is a 2D array, a packedRP or a sparseRP.
+    """
+
+    # triangular storage has no cheap full rows
+    if hasattr(bitmap, 'bits') and bitmap.bits.ndim == 1:
+        bitmap = bitmap.toarray()
+
+    n_rows, n_cols = bitmap.shape
+    f = numpy.empty((n_rows, n_cols))
+
+    _column_pass(bitmap, f)
+
+    step = max(1, CHUNK // n_cols)
+    for r0 in range(0, n_rows, step):
+        rows = f[r0:r0+step]
+        rows[:] = _lower_envelope(rows.T.copy())
+        numpy.sqrt(rows, rows)
+
     return f
 
+def _rows(bitmap, r0, r1):
+    """
+    Rows r0 ... r1-1 of bitmap as dense bool array.
+    """
+
+    n_cols = bitmap.shape[1]
+
+    # sparseRP (CSR)
+    if hasattr(bitmap, 'indptr'):
+        block = numpy.zeros((r1-r0, n_cols), dtype=bool)
+        ptr = bitmap.indptr[r0:r1+1]
+        rows = numpy.repeat(numpy.arange(r1-r0), numpy.diff(ptr))
+        block[rows, bitmap.indices[ptr[0]:ptr[-1]]] = True
+        return block
+
+    # packedRP
+    if hasattr(bitmap, 'bits'):
+        return numpy.unpackbits(bitmap.bits[r0:r1], axis=1)[:, :n_cols] != 0
+
+    return numpy.asarray(bitmap[r0:r1]) != 0
+
+def _column_pass(bitmap, f):
+    """
+    Fills f with the squared distance of every cell to the
+    nearest nonzero cell in its column. Rows are read block
+    by block, once top down (nearest above) and once bottom
+    up (nearest below).
+    """
+
+    n_rows, n_cols = f.shape
+    step = max(1, BLOCK // n_cols)
+    blocks = [(r0, min(r0+step, n_rows)) for r0 in range(0, n_rows, step)]
+
+    # row of the last set cell above, per column
+    last = numpy.empty(n_cols)
+    last.fill(-numpy.inf)
+
+    for r0, r1 in blocks:
+        index = numpy.arange(r0, r1, dtype=float)[:, numpy.newaxis]
+        above = numpy.where(_rows(bitmap, r0, r1), index, -numpy.inf)
+        above[0] = numpy.maximum(above[0], last)
+        numpy.maximum.accumulate(above, axis=0, out=above)
+        last = above[-1].copy()
+        f[r0:r1] = index - above
+
+    # row of the next set cell below, per column
+    following = numpy.empty(n_cols)
+    following.fill(numpy.inf)
+
+    for r0, r1 in reversed(blocks):
+        index = numpy.arange(r0, r1, dtype=float)[:, numpy.newaxis]
+        below = numpy.where(_rows(bitmap, r0, r1), index, numpy.inf)
+        below[-1] = numpy.minimum(below[-1], following)
+        below = numpy.minimum.accumulate(below[::-1], axis=0)[::-1]
+        following = below[0].copy()
+        numpy.minimum(f[r0:r1], below - index, f[r0:r1])
+        f[r0:r1] **= 2
+
+def _lower_envelope(f):
+    """
+    1D squared distance transform of every column of f:
+    d[q] = min_p (q-p)^2 + f[p], f is inf where there is no
+    parabola. Returns d transposed (one row per column of f).
+
+    All columns share one loop over the positions q. Every
+    column c has its own stack of parabolas (positions v,
+    v^2 + f[v] in h, row c of each) and the boundaries z 
+    between them. The top entries are also kept per column,
+    so only pops need to look into the stacks.
+    """
+
+    n, B = f.shape
+    inf = numpy.inf
+
+    v = numpy.zeros((B, n), dtype=numpy.int64)
+    h = numpy.zeros((B, n))
+    z = numpy.zeros((B, n))
+    vf, hf, zf = v.ravel(), h.ravel(), z.ravel()
+
+    # top of stack per column (-1 for empty stacks) and copies
+    # of the top entries, v_top = -1 keeps the first intersection
+    # finite
+    k = -numpy.ones(B, dtype=numpy.int64)
+    v_top, h_top, z_top = -numpy.ones(B), numpy.zeros(B), numpy.zeros(B)
+
+    all_cols = numpy.arange(B)
+    full = numpy.isfinite(f).all(axis=1)
+    empty = True
+
+    for q in range(n):
+
+        # views for the usual case of all columns taking part
+        cols = slice(None) if full[q] else numpy.flatnonzero(f[q] < inf)
+        c = all_cols[cols]
+        if len(c) == 0: continue
+
+        hq = f[q, cols] + q*q
+        kc = k[cols]
+
+        # intersection with the top parabola
+        s = (hq - h_top[cols]) / (2.0*(q - v_top[cols]))
+        hidden = s <= z_top[cols]
+
+        # empty stacks just get the new parabola
+        if empty:
+            s[kc < 0] = -inf
+            hidden &= kc >= 0
+
+        # pop the parabolas hidden by the new one
+        pos = numpy.flatnonzero(hidden)
+        while len(pos):
+            kc[pos] -= 1
+            top = c[pos]*n + kc[pos]
+            sp = (hq[pos] - hf[top]) / (2.0*(q - vf[top]))
+            s[pos] = sp
+            pos = pos[sp <= zf[top]]
+
+        kc += 1
+        top = c*n + kc
+        vf[top] = q
+        hf[top] = hq
+        zf[top] = s
+
+        k[cols] = kc
+        v_top[cols] = q
+        h_top[cols] = hq
+        z_top[cols] = s
+
+        if empty: empty = (k < 0).any()
+
+    # the parabola of q is the no. of boundaries z[1..k] below q,
+    # every boundary counts from floor(z)+1 on
+    inside = numpy.arange(n)[numpy.newaxis, :] <= k[:, numpy.newaxis]
+    inside[:, 0] = False
+    start = numpy.clip(numpy.floor(z[inside]) + 1, 0, n).astype(numpy.int64)
+    start += numpy.repeat(all_cols*(n+1), numpy.maximum(k, 0))
+
+    seg = numpy.bincount(start, minlength=B*(n+1)).reshape(B, n+1)
+    top = numpy.cumsum(seg[:, :n], axis=1)
+    top += (all_cols*n)[:, numpy.newaxis]
+    del seg
+
+    q = numpy.arange(n, dtype=float)[numpy.newaxis, :]
+    d = hf[top]
+    d -= 2.0*q*vf[top]
+    d += q*q
+    d[k < 0] = inf
+
+    return d
 
 if __name__ == '__main__':
-    try:
-        import psyco
-        psyco.full()
-    except ImportError:
-        pass
-    
     import pylab
     from numpy import random
     vec = random.random((1000,1000)) < 0.0001
@@ -39,5 +203,3 @@ if __name__ == '__main__':
 
     pylab.imshow(distance_transform(vec))
     pylab.show()
-
-
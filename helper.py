@@ -35,7 +35,28 @@
 """
 from numpy import *
 from numpy import matlib
+from numpy.lib.format import open_memmap
+from numpy.lib.stride_tricks import as_strided
 import pylab
+import math
+
+# edge length of the tiles used by the distance engine.
+# peak temporary memory is about TILESIZE**2 floats.
+TILESIZE = 1024
+
+# norms with d(x,y) == d(y,x), only these give symmetric RPs
+SYMMETRICNORMS = ('max','euclidean','l1')
+
+# max. no. of RP points per stack of trials, see bcrqa()
+BATCHCELLS = 2**21
+
+# share of the longest diagonals (too few points) left out
+# of the TREND fit, see recurrenceTimeMeasures()
+TRENDCUT = 0.1
+
+# no. of histogramme bins per pass when searching eps for a
+# given recurrence rate, see rrEps()
+RRBINS = 4096
 
 ##################################
 ##  	Helper Functions		##
@@ -45,11 +66,13 @@ import pylab
 def normaliseData(X):
 	"""
 	Normalises X and Y to mu=0 & sigma = 1	(in-place)	
+	Multi-column input (T x channels) is normalised
+	per channel.
 	"""
 	
 	# mu & sigma
-	meanX = X.mean()
-	stdX = X.std()
+	meanX = X.mean(axis=0)
+	stdX = X.std(axis=0)
 
 	X -= meanX;
 	X /= stdX;
@@ -61,8 +84,21 @@ def embedData(X,dim,tau):
 	Embeds vector a X with given 
 	embedding dimension and delay
 	and returns it to caller
+
+	Multi-column input (T x channels) gives an embedding
+	of dim*channels columns, all channels of delay 0 first,
+	then delay tau and so on. 
+
+	The result is a read-only view on X (no copy) where
+	the strides allow it, that is always for vectors
+	and for C-contiguous multi-column input with tau=1.
+	Integer data is converted to float64 first, unsigned
+	differences would wrap around.
 	"""
 	
+	X = asarray(X)
+	if not issubdtype(X.dtype,inexact): X = X.astype(float64)
+	
 	# data length		
 	lenData = len(X)
 
@@ -71,52 +107,729 @@ def embedData(X,dim,tau):
 		raise ValueError,"Data not long enough for embedding parameters"		
 
 	lenEmbData = lenData - (dim-1)*tau		
-		
-	# alloc memory
-	Xemb = zeros( (lenData - (dim-1)*tau, dim), dtype=float32 )
 
-	# assign values
-	for i in range(dim):
+	# a 1-column view for vectors
+	if X.ndim == 1: X = X[:,newaxis]
+	nChannels = X.shape[1]
+		
+	# Xemb[n,i,c] = X[n+i*tau,c], strides only, no copy
+	step, channel = X.strides
+	Xemb = as_strided(X, (lenEmbData,dim,nChannels),
+		(step,tau*step,channel), writeable=False)
 
-		Xemb[:,i] = X[i*tau : lenData -( (dim-1)-i ) *tau]
+	# the delays and channels can share one axis if every
+	# delay starts right after the channels of the last one
+	if dim == 1 or tau*step == nChannels*channel:
+		return as_strided(X, (lenEmbData,dim*nChannels),
+			(step,channel), writeable=False)
 
 	#return to caller
-	return Xemb
+	return Xemb.reshape(lenEmbData,dim*nChannels)
+
+def normaliseStack(X):
+	"""
+	normaliseData() of a stack of series (trials x T or
+	trials x T x channels), per trial (in-place).
+	"""
+
+	X -= X.mean(axis=1)[:,newaxis]
+	X /= X.std(axis=1)[:,newaxis]
+
+	return X
+
+def embedStack(X,dim,tau):
+	"""
+	embedData() of a stack of series of the same length,
+	X is (trials x T) or (trials x T x channels). Returns
+	(trials x points x dim*channels).
+	"""
+
+	X = asarray(X)
+	if not issubdtype(X.dtype,inexact): X = X.astype(float64)
+	if X.ndim == 2: X = X[:,:,newaxis]
+	nTrials, lenData, nChannels = X.shape
+
+	if (dim-1)*tau >= lenData:
+		raise ValueError,"Data not long enough for embedding parameters"
+
+	lenEmbData = lenData - (dim-1)*tau
+
+	# Xemb[t,n,i,c] = X[t,n+i*tau,c]
+	trial, step, channel = X.strides
+	Xemb = as_strided(X, (nTrials,lenEmbData,dim,nChannels),
+		(trial,step,tau*step,channel), writeable=False)
+
+	return Xemb.reshape(nTrials,lenEmbData,dim*nChannels)
+
+def prepareData(X,Y,dim,tau,normalise=True):
+	"""
+	Normalises (optional) and embeds X and Y, the
+	common first step of all core functions. An
+	empty Y means Y = X (RP instead of CRP), then X
+	is only processed once and Yemb is Xemb.
+	"""
+
+	# RP/CRP switch	
+	if len(Y) == 0:
+		if normalise: X = normaliseData(X)
+		Xemb = embedData(X,dim,tau)
+		return Xemb,Xemb
+
+	#normalise
+	if normalise: 
+		X = normaliseData(X)
+		Y = normaliseData(Y)
+
+	#embed
+	Xemb = embedData(X,dim,tau)
+	Yemb = embedData(Y,dim,tau)
+
+	return Xemb,Yemb
+
+def allocMatrix(shape,dtype,filename=None):
+	"""
+	Returns a zeroed matrix, or for a filename a .npy file
+	mapped into memory (numpy.memmap). Such a file can be
+	opened again with numpy.load(filename,mmap_mode='r').
+	"""
+
+	if filename is None: return zeros(shape,dtype=dtype)
+
+	return open_memmap(filename,mode='w+',dtype=dtype,shape=shape)
+
+def ordinalCodes(Xemb,nChannels=1):
+	"""
+	Symbolises every embedded vector by its ordinal pattern,
+	i.e. the permutation that sorts it, coded as integer in
+	[0,dim!) (Lehmer code). Multi-column embeddings (see
+	embedData) get one pattern per channel, combined into
+	one code. Equal values are ordered by their position.
+	"""
+
+	dim = Xemb.shape[1] // nChannels
+	if math.factorial(dim)**nChannels >= 2**63:
+		raise ValueError,"Too many ordinal patterns for dim = %d" % dim
+
+	codes = zeros(len(Xemb),dtype=int64)
+
+	for c in range(nChannels):
+
+		order = argsort(Xemb[:,c::nChannels],axis=1,kind='mergesort')
+
+		# digit i counts the later entries that sort below entry i
+		for i in range(dim):
+			smaller = (order[:,i+1:] < order[:,i,newaxis]).sum(axis=1)
+			codes = codes*(dim-i) + smaller
+
+	return codes
+
+def isSymmetric(Xemb,Yemb,norm):
+	"""
+	True if the RP of Xemb and Yemb is symmetric, i.e. an 
+	RP (not a CRP) computed with a symmetric norm.
+	"""
+
+	return Yemb is Xemb and norm in SYMMETRICNORMS
+
+def tileSlices(nRows,nCols,tileSize=TILESIZE,upper=False,theiler=0):
+	"""
+	Generates the (rows,cols) slices of all tiles
+	needed to cover a nRows x nCols matrix. Tiles are
+	visited row-block by row-block. With upper=True only
+	the tiles on and above the main diagonal are visited.
+	Tiles with all points closer than theiler to the main 
+	diagonal are skipped.
+	"""
+
+	for r0 in range(0,nRows,tileSize):
+		r1 = minimum(r0+tileSize,nRows)
+		for c0 in range(r0 if upper else 0,nCols,tileSize):
+			c1 = minimum(c0+tileSize,nCols)
+			if maximum(c1-1-r0,r1-1-c0) < theiler: continue
+			yield slice(r0,r0+tileSize), slice(c0,c0+tileSize)
+
+def clearTheiler(block,r0,c0,theiler,value=0):
+	"""
+	Clears all points of block, the part of an RP starting
+	at row r0 and column c0, closer than theiler to the main 
+	diagonal (in-place), or sets them to value. Only the rows
+	meeting that band are touched.
+	"""
+
+	if theiler <= 0: return block
+
+	nRows, nCols = block.shape
+	a = int(clip(c0-theiler+1-r0,0,nRows))
+	b = int(clip(c0+nCols+theiler-1-r0,0,nRows))
+	if a >= b: return block
+
+	rows = arange(r0+a,r0+b)[:,newaxis]
+	cols = arange(c0,c0+nCols)[newaxis,:]
+	block[a:b][absolute(cols-rows) < theiler] = value
+
+	return block
+
+def fillTiles(out,Xemb,Yemb,norm='max',eps=None,tileSize=TILESIZE,theiler=0):
+	"""
+	Fills out with the distance matrix (eps is None) or
+	the RP of Xemb (columns) and Yemb (rows), tile by tile.
+	For symmetric RPs only the upper tiles are computed
+	and mirrored. RP points closer than theiler to the main
+	diagonal are left out (out has to be zeroed).
+	"""
+
+	nRows, nCols = out.shape
+	upper = isSymmetric(Xemb,Yemb,norm)
+	if eps is None: theiler = 0
+
+	for rows,cols in tileSlices(nRows,nCols,tileSize,upper,theiler):
+
+		if eps is None:
+			tile = distTile(Xemb[cols],Yemb[rows],norm)
+		else:
+			tile = clearTheiler(recTile(Xemb[cols],Yemb[rows],eps,norm),
+				rows.start,cols.start,theiler)
+
+		out[rows,cols] = tile
+		if upper and rows != cols: out[cols,rows] = tile.T
+
+	return out
+
+def distTile(Xemb,Yemb,norm='max'):
+	"""
+	Computes the distances between all points in Yemb (rows)
+	and all points in Xemb (columns) by broadcasting. The
+	tile is accumulated one embedding dimension at a time,
+	so the only temporaries are of the size of the tile.
+	Euclidean distances come from a matrix product, see
+	sqDistTile(). Stacks of point sets (trials x points x
+	dims) give a stack of tiles, one per trial.
+	"""
+
+	# "switch norms"
+	if norm == 'max':
+
+		tile = abs(Yemb[...,:,0,newaxis] - Xemb[...,newaxis,:,0])
+		for k in range(1,Xemb.shape[-1]):
+			maximum(tile, abs(Yemb[...,:,k,newaxis] - Xemb[...,newaxis,:,k]), tile)
+
+	elif norm == 'min':
+
+		tile = Yemb[...,:,0,newaxis] - Xemb[...,newaxis,:,0]
+		for k in range(1,Xemb.shape[-1]):
+			minimum(tile, Yemb[...,:,k,newaxis] - Xemb[...,newaxis,:,k], tile)
+		absolute(tile,tile)
+
+	elif norm == 'l1':
+
+		tile = abs(Yemb[...,:,0,newaxis] - Xemb[...,newaxis,:,0])
+		for k in range(1,Xemb.shape[-1]):
+			tile += abs(Yemb[...,:,k,newaxis] - Xemb[...,newaxis,:,k])
+
+	elif norm == 'euclidean':
+
+		tile = sqrt(sqDistTile(Xemb,Yemb))
+
+	else:
+		raise Exception,"Only maximum, minimum, euclidean and l1 norm supported now"
+
+	return tile
+
+def sqDistTile(Xemb,Yemb):
+	"""
+	Squared euclidean distances between all points in Yemb
+	(rows) and Xemb (columns) as |y|^2 + |x|^2 - 2 y.x, so
+	the bulk of the work is one matrix product (BLAS).
+	Both are shifted by the centre of Yemb first, far from 
+	the origin the norms would swamp the differences.
+	"""
+
+	centre = Yemb.mean(axis=-2)[...,newaxis,:]
+	Yemb, Xemb = Yemb - centre, Xemb - centre
+
+	tile = matmul(Yemb,Xemb.swapaxes(-1,-2))
+	tile *= -2
+	tile += (Yemb**2).sum(axis=-1)[...,:,newaxis]
+	tile += (Xemb**2).sum(axis=-1)[...,newaxis,:]
+
+	# rounding can make the difference slightly negative
+	return maximum(tile,0,tile)
+
+def recTile(Xemb,Yemb,eps,norm='max'):
+	"""
+	Returns distTile() < eps. Euclidean distances are
+	compared squared, no square roots are taken.
+	"""
+
+	if norm == 'euclidean':
+		return sqDistTile(Xemb,Yemb) < eps*eps
+
+	return distTile(Xemb,Yemb,norm) < eps
+
+def rrEps(Xemb,Yemb,rr,norm='max',tileSize=TILESIZE):
+	"""
+	Returns the eps that gives the (C)RP of Xemb and Yemb the
+	recurrence rate rr, i.e. the (rr*N^2)-th smallest distance
+	(nudged up, as the threshold is strict). Exact unless
+	there are ties at that distance, then the RR is a bit
+	higher.
+
+	Nothing is sorted and no N^2 distances are stored: the
+	distances are histogrammed tile by tile, which tells which
+	bin holds the wanted one. That bin is refined by further
+	passes until it is small enough to collect its distances
+	and select with numpy.partition(), or until it only holds
+	one distinct distance (ties), which is then the wanted
+	one. Memory is O(tileSize^2), usually 2 passes are needed.
+	"""
+
+	nRows, nCols = len(Yemb), len(Xemb)
+	rank = int(clip(round(rr*nRows*nCols),1,nRows*nCols)) - 1
+
+	# euclidean distances are searched squared
+	squared = norm == 'euclidean'
+	upper = isSymmetric(Xemb,Yemb,norm)
+
+	def tiles():
+		for rows,cols in tileSlices(nRows,nCols,tileSize,upper):
+			if squared:
+				tile = sqDistTile(Xemb[cols],Yemb[rows])
+			else:
+				tile = distTile(Xemb[cols],Yemb[rows],norm)
+			# tiles above the main diagonal count twice
+			yield tile.ravel(), 2 if upper and rows != cols else 1
+
+	# the bins chosen so far, (lo,scale,bin) per pass
+	path = []
+
+	def inBin(tile):
+		for lo,scale,b in path:
+			tile = tile[binIndex(tile,lo,scale) == b]
+		return tile
+
+	# all distances are in [0,hi]
+	ranges = maximum(Xemb.max(axis=0),Yemb.max(axis=0)) - minimum(Xemb.min(axis=0),Yemb.min(axis=0))
+	lo, hi = 0., float(ranges.sum() if norm == 'l1' else (ranges**2).sum() if squared else ranges.max())
+
+	# every pass shrinks the bin RRBINS times, far below the
+	# float resolution long before the last one
+	dist = None
+	for nPass in range(16):
+
+		scale = RRBINS / maximum(hi-lo,finfo(float64).tiny)
+		counts = zeros(RRBINS,dtype=int64)
+		vMin, vMax = inf, -inf
+		for tile,weight in tiles():
+			tile = inBin(tile)
+			if len(tile) == 0: continue
+			vMin, vMax = minimum(vMin,tile.min()), maximum(vMax,tile.max())
+			counts += weight*bincount(binIndex(tile,lo,scale),minlength=RRBINS)
+
+		# the bin chosen last holds only ties
+		if vMin == vMax:
+			dist = float(vMin)
+			break
+
+		b = int(searchsorted(cumsum(counts),rank+1))
+		rank -= int(counts[:b].sum())
+		path.append( (lo,scale,b) )
+		lo, hi = lo+b/scale, lo+(b+1)/scale
+
+		if counts[b] <= tileSize**2: break
+
+	# the rank-th distance of the last bin
+	if dist is None:
+		found = []
+		for tile,weight in tiles():
+			found += [inBin(tile)]*weight
+		found = concatenate(found)
+		dist = float(partition(found,rank)[rank])
+
+	# smallest eps with dist < eps
+	if not squared: return nextafter(dist,inf)
+
+	eps = sqrt(nextafter(dist,inf))
+	while eps*eps <= dist: eps = nextafter(eps,inf)
+
+	return eps
+
+def binIndex(values,lo,scale):
+	"""
+	Histogramme bin of values for RRBINS bins of width
+	1/scale from lo on, values outside go to the edge bins.
+	"""
+
+	return clip(((values-lo)*scale).astype(int64),0,RRBINS-1)
+
+def pairDist(Xemb,Yemb,norm='max'):
+	"""
+	Computes the distances between the points Xemb[n]
+	and Yemb[n], i.e. row by row.
+	"""
+
+	# "switch norms"
+	if norm == 'max':
+		return abs(Yemb-Xemb).max(axis=1)
+	elif norm == 'min':
+		return abs((Yemb-Xemb).min(axis=1))
+	elif norm == 'l1':
+		return abs(Yemb-Xemb).sum(axis=1)
+	elif norm == 'euclidean':
+		return sqrt(((Yemb-Xemb)**2).sum(axis=1))
+	else:
+		raise Exception,"Only maximum, minimum, euclidean and l1 norm supported now"
+
+def pairRec(Xemb,Yemb,eps,norm='max'):
+	"""
+	Returns pairDist() < eps, euclidean distances are
+	compared squared. For a vector of eps the distances
+	are computed once, the result has one row per eps.
+	"""
+
+	eps = asarray(eps)
+
+	if norm == 'euclidean':
+		dist, eps = ((Yemb-Xemb)**2).sum(axis=1), eps*eps
+	else:
+		dist = pairDist(Xemb,Yemb,norm)
+
+	return dist < eps[...,newaxis]
+
+def diagonalSweep(Xemb,Yemb,eps,norm='max',theiler=0):
+	"""
+	Computes the line histogrammes of the (C)RP of Xemb (columns)
+	and Yemb (rows) without ever storing it. The diagonals
+	i-j = k are computed one at a time from the embedded data.
+	Walking k downwards, every column is visited top to bottom,
+	so the vertical lines can be followed with one running 
+	length per column. Memory is O(N).
+
+	Returns the histogrammes of diagonal and vertical lines
+	and the no. of recurrent points. For a vector of eps the 
+	distances are computed once and thresholded against all
+	of them, the results then have one row per eps.
+	"""
+
+	nRows, nCols = len(Yemb), len(Xemb)
+	epss = atleast_1d(eps)
+
+	# current vertical line length per eps and column
+	vertRun = zeros( (len(epss),nCols), dtype=int32)
+	diagHist = zeros( (len(epss),minimum(nRows,nCols)+1), dtype=int64)
+	vertHist = zeros( (len(epss),nRows+1), dtype=int64)
+	diagLines, vertLines = [], []
+	allPoints = zeros(len(epss),dtype=int64)
+
+	for k in range(nCols-1,-nRows,-1):
+
+		# columns i (and rows i-k) on this diagonal
+		i0, i1 = int(maximum(k,0)), int(minimum(nCols,nRows+k))
+
+		if abs(k) < theiler:
+			rec = zeros( (len(epss),i1-i0), dtype=bool)
+		else:
+			rec = pairRec(Xemb[i0:i1],Yemb[i0-k:i1-k],epss,norm)
+			allPoints += count_nonzero(rec,axis=1)
+			diagLines.append(rowRuns(rec))
+
+		# follow the vertical lines of the visited columns,
+		# a line ends where run > 0 but rec is not set
+		run = vertRun[:,i0:i1]
+		ended = nonzero((run > 0) > rec)
+		vertLines.append( (ended[0],run[ended]) )
+		run += 1
+		run *= rec
+
+		# keep the list of pending lines short
+		if len(vertLines) >= 256:
+			labelHist(diagHist,diagLines)
+			labelHist(vertHist,vertLines)
+			diagLines, vertLines = [], []
+
+	# lines still running at the bottom
+	ended = nonzero(vertRun > 0)
+	vertLines.append( (ended[0],vertRun[ended]) )
+	labelHist(diagHist,diagLines)
+	labelHist(vertHist,vertLines)
+
+	if ndim(eps) == 0: return diagHist[0],vertHist[0],allPoints[0]
+
+	return diagHist,vertHist,allPoints
+
+def symmetricSweep(Xemb,eps,norm='max',theiler=0):
+	"""
+	diagonalSweep() for symmetric RPs. Only the diagonals above
+	the main diagonal are computed, their lines count twice.
+	Walking these diagonals upwards visits every row left to
+	right and every column bottom to top. The vertical lines
+	of the lower triangle are the horizontal ones of the upper
+	triangle, so both are followed with one running length per 
+	row/column. For theiler == 0 the lines crossing the main 
+	diagonal are joined up at the end.
+	"""
+
+	nPoints = len(Xemb)
+	first = int(maximum(theiler,1))
+	epss = atleast_1d(eps)
 
-def getDiagLines(RP):
+	colRun = zeros( (len(epss),nPoints), dtype=int32)
+	rowRun = zeros( (len(epss),nPoints), dtype=int32)
+
+	# lines right next to the main diagonal (for theiler == 0)
+	above = zeros( (len(epss),nPoints), dtype=int64)
+	right = zeros( (len(epss),nPoints), dtype=int64)
+
+	diagHist = zeros( (len(epss),nPoints+1), dtype=int64)
+	vertHist = zeros( (len(epss),nPoints+1), dtype=int64)
+	diagLines, vertLines = [], []
+	allPoints = zeros(len(epss),dtype=int64)
+
+	for k in range(first,nPoints):
+
+		# rows j and columns j+k
+		rec = pairRec(Xemb[k:],Xemb[:nPoints-k],epss,norm)
+		allPoints += count_nonzero(rec,axis=1)
+		diagLines.append(rowRuns(rec))
+
+		for run,offset,edge in ( (colRun[:,k:],k,above), 
+			(rowRun[:,:nPoints-k],0,right) ):
+
+			# run > 0 but not recurrent any more
+			e, i = nonzero((run > 0) > rec)
+			L = run[e,i]
+			vertLines.append( (e,L) )
+
+			# started at k == 1, i.e. next to the main diagonal
+			at = k-L == 1
+			edge[e[at],i[at]+offset] = L[at]
+
+			run += 1
+			run *= rec
+
+		if len(diagLines) >= 256:
+			labelHist(diagHist,diagLines)
+			labelHist(vertHist,vertLines)
+			diagLines, vertLines = [], []
+
+	# lines running into the top/right edge; column i was last
+	# visited at k == i, row j at k == nPoints-1-j
+	last = arange(nPoints)
+	for run,lastK,edge in ( (colRun,last,above), (rowRun,nPoints-1-last,right) ):
+		e, i = nonzero(run > 0)
+		L = run[e,i]
+		vertLines.append( (e,L) )
+		at = lastK[i]-L+1 == 1
+		edge[e[at],i[at]] = L[at]
+
+	labelHist(diagHist,diagLines)
+	labelHist(vertHist,vertLines)
+	diagHist *= 2
+	allPoints *= 2
+
+	if theiler == 0:
+		main = pairRec(Xemb,Xemb,epss,norm)
+		allPoints += count_nonzero(main,axis=1)
+		labelHist(diagHist,[rowRuns(main)])
+		for e in range(len(epss)):
+			vertHist[e] = joinMainDiagonal(vertHist[e],main[e],above[e],right[e])
+
+	if ndim(eps) == 0: return diagHist[0],vertHist[0],allPoints[0]
+
+	return diagHist,vertHist,allPoints
+
+def joinMainDiagonal(vertHist,main,above,right):
+	"""
+	Vertical lines of a symmetric RP without its main diagonal
+	are given in vertHist. Where the main diagonal is recurrent, 
+	the line above[i] ending right above it and the line 
+	right[i] starting right below it (the horizontal line right 
+	of it by symmetry) are one line of length above+1+right.
+	"""
+
+	i = flatnonzero(main)
+	a, r = above[i], right[i]
+
+	vertHist = subHist(vertHist,a[a > 0])
+	vertHist = subHist(vertHist,r[r > 0])
+
+	return addHist(vertHist,a+r+1)
+
+def getDiagLines(RP,tileSize=TILESIZE,theiler=0):
 	"""
 	Extract the histogramme of all diagonal lines
-	in a recurrence plot. Note: numpy does not 
-	have convenient spdiags(), therefore the
-	crappy looping.
+	in a recurrence plot, hist[l] is the no. of lines
+	of length l. The diagonals are gathered in blocks
+	(one column per diagonal, about tileSize**2 points
+	per block) and measured in one vectorised pass.
+	Diagonals closer than theiler to the main diagonal
+	are not visited.
 	"""
 	
-	# no. of diagonals on one axis
-	nDiags = alen(RP);
-	
-	#alloc empty array, force int
-	lines = array([], dtype=int32)
+	# packed RPs know their own lines
+	if hasattr(RP,'diagHist'): return RP.diagHist(theiler)
+
+	nRows, nCols = RP.shape
+	hist = zeros(1,dtype=int64)
+
+	# no. of diagonals per block
+	step = int(maximum(1,tileSize**2 // nRows))
+
+	# diagonals below and above the theiler window
+	if theiler > 0:
+		ranges = [(-nRows+1,1-theiler),(theiler,nCols)]
+	else:
+		ranges = [(-nRows+1,nCols)]
+
+	blocks = [(k0,minimum(k0+step,kEnd)) for kFirst,kEnd in ranges
+		for k0 in range(kFirst,kEnd,step)]
 
-	# get all diagonals and extract line lengths	
-	for offset in range(-nDiags +1,nDiags):
-		lines = append( lines, maxConsElements(diag(RP,offset)) )
+	for k0,k1 in blocks:
+
+		k = arange(k0,k1)
+
+		# only rows that meet one of the diagonals
+		rows = arange(maximum(0,-k[-1]),minimum(nRows,nCols-k[0]))[:,newaxis]
+		cols = rows + k[newaxis,:]
+		valid = (cols >= 0) & (cols < nCols)
+
+		# block[j,d] = RP[j,j+k[d]], zero outside the RP
+		block = RP[rows,clip(cols,0,nCols-1)] != 0
+		block &= valid
+
+		hist = addHist(hist,runLengths(block))
 		
-	return lines
+	return hist
 
-def getVertLines(RP):
+def getVertLines(RP,tileSize=TILESIZE,theiler=0):
 	"""
 	Extract the histogramme of all vertical lines
-	in a recurrence plot.
+	in a recurrence plot, hist[l] is the no. of lines
+	of length l. Blocks of columns are measured in one
+	vectorised pass each. Points closer than theiler to 
+	the main diagonal are cleared block by block.
 	"""
 
-	#alloc empty array, force int
-	lines = array([], dtype=int32)
-	
-	#extract all columns individually
-	for i in range(alen(RP)):
-		lines = append( lines, maxConsElements(RP[:,i]) ) 
+	# packed RPs know their own lines
+	if hasattr(RP,'vertHist'): return RP.vertHist(theiler)
 
-	return lines
+	nRows, nCols = RP.shape
+	hist = zeros(1,dtype=int64)
+
+	# no. of columns per block
+	step = int(maximum(1,tileSize**2 // nRows))
+
+	for c0 in range(0,nCols,step):
+		block = clearTheiler(RP[:,c0:c0+step] != 0,0,c0,theiler)
+		hist = addHist(hist,runLengths(block))
+
+	return hist
+
+def columnSweep(RP,tileSize=TILESIZE,theiler=0):
+	"""
+	getVertLines() that also collects what the recurrence
+	time measures need from the same blocks of columns:
+	the histogramme of white vertical lines (runs of zeros
+	with a recurrence above and below, see gapLengths) and
+	the no. of recurrent points per diagonal (offset k is
+	at k+nRows-1). Returns vertHist, whiteHist, diagPoints.
+
+	For white lines the theiler window counts as recurrent,
+	so the first return after it is a white line too.
+	"""
+
+	nRows, nCols = RP.shape
+	vertHist = zeros(1,dtype=int64)
+	whiteHist = zeros(1,dtype=int64)
+	diagPoints = zeros(nRows+nCols-1,dtype=int64)
+
+	# no. of columns per block
+	step = int(maximum(1,tileSize**2 // nRows))
+
+	for c0 in range(0,nCols,step):
+		block = asarray(RP[:,c0:c0+step]) != 0
+		black = clearTheiler(block.copy(),0,c0,theiler)
+
+		vertHist = addHist(vertHist,runLengths(black))
+		whiteHist = addHist(whiteHist,gapLengths(clearTheiler(block,0,c0,theiler,1)))
+
+		rows, cols = black.nonzero()
+		diagPoints += bincount(cols+c0-rows+nRows-1,minlength=len(diagPoints))
+
+	return vertHist, whiteHist, diagPoints
+
+def runLengths(block):
+	"""
+	Returns the lengths of all runs of ones down the 
+	columns of block. The columns are padded with zeros
+	and chained, so one diff() finds all of them.
+	"""
+
+	nRows, nCols = block.shape
+
+	padded = zeros( (nCols,nRows+2), dtype=int8)
+	padded[:,1:-1] = block.T
+
+	tmp = diff(padded.ravel())
+	ind1 = flatnonzero(tmp == 1)
+	ind2 = flatnonzero(tmp == -1)
+
+	return ind2-ind1
+
+def gapLengths(block):
+	"""
+	Returns the lengths of all runs of zeros down the 
+	columns of block that have a one above and below.
+	Runs touching the first or last row are open, we
+	do not know where they end.
+	"""
+
+	nRows, nCols = block.shape
+
+	padded = zeros( (nCols,nRows+2), dtype=int8)
+	padded[:,1:-1] = block.T == 0
+
+	tmp = diff(padded.ravel())
+	ind1 = flatnonzero(tmp == 1)
+	ind2 = flatnonzero(tmp == -1)
+
+	# ind1 is the first row of a run, ind2 the one after it
+	inner = (ind1 % (nRows+2) > 0) & (ind2 % (nRows+2) < nRows)
+
+	return (ind2-ind1)[inner]
+
+def rowRuns(block):
+	"""
+	Returns the row and the length of all runs of ones
+	along the rows of block.
+	"""
+
+	nRows, nCols = block.shape
+
+	padded = zeros( (nRows,nCols+2), dtype=int8)
+	padded[:,1:-1] = block
+
+	tmp = diff(padded.ravel())
+	ind1 = flatnonzero(tmp == 1)
+	ind2 = flatnonzero(tmp == -1)
+
+	return ind1 // (nCols+2), ind2-ind1
+
+def stackRuns(blocks):
+	"""
+	runLengths() of a stack of blocks. Returns the block
+	index and the length of all runs of ones.
+	"""
+
+	nBlocks, nRows, nCols = blocks.shape
+
+	padded = zeros( (nBlocks,nCols,nRows+2), dtype=int8)
+	padded[:,:,1:-1] = blocks.swapaxes(1,2)
+
+	tmp = diff(padded.ravel())
+	ind1 = flatnonzero(tmp == 1)
+	ind2 = flatnonzero(tmp == -1)
+
+	return ind1 // (nCols*(nRows+2)), ind2-ind1
 
 def maxConsElements(vector):
 	"""
@@ -133,57 +846,231 @@ def maxConsElements(vector):
 	
 	return lines
 
-def qualifyRP(RP,theiler=1,lMin=2,vMin=2):
+def qualifyRP(RP,theiler=1,lMin=2,vMin=2,extras=False):
 	"""
 	This functions takes an RP matrix as an input
 	and computes the complexity measures
+
+	With extras=True it returns (rqa, rtm, whiteHist), with
+	the recurrence time measures rtm (see recurrenceTimeMeasures)
+	and the histogramme of white vertical lines. These come
+	from the same column sweep as the vertical lines, see
+	columnSweep(). Only for dense RPs in memory (no memmaps).
 	"""
 	
+	if not extras:
+		diagHist, vertHist, allPoints = rpHists(RP,theiler)
+		return rqaMeasures(diagHist,vertHist,allPoints,RP.size,lMin,vMin)
+
+	if hasattr(RP,'lineHists'):
+		raise ValueError,"Recurrence times need a dense RP"
+
+	# the sweep reads blocks of columns, from a file that
+	# would be the whole file per block
+	if isinstance(RP,memmap):
+		raise ValueError,"Recurrence times need an RP in memory, not a memmap"
+
+	vertHist, whiteHist, diagPoints = columnSweep(RP,theiler=theiler)
+	diagHist = getDiagLines(RP,theiler=theiler)
+
+	rqa = rqaMeasures(diagHist,vertHist,diagPoints.sum(),RP.size,lMin,vMin)
+	rtm = recurrenceTimeMeasures(whiteHist,diagPoints,RP.shape,rqa,theiler)
+
+	return rqa, rtm, whiteHist
+
+def rpHists(RP,theiler=1):
+	"""
+	Returns the histogrammes of diagonal and vertical lines
+	and the no. of recurrent points of an RP (any format),
+	ignoring points closer than theiler to the main diagonal.
+	"""
+
+	if hasattr(RP,'lineHists'):
+		# packed RPs handle theiler exclusion themselves
+		return RP.lineHists(theiler)
+
+	elif isinstance(RP,memmap):
+		# RPs on disk are read row block by row block,
+		# packed and swept like packed RPs
+		from packed import packedLineHists, mappedRowBlocks
+		return packedLineHists(mappedRowBlocks(RP),RP.shape,theiler)
+
+	# all recurrent points outside the theiler window
+	allPoints = sum(RP, dtype=float32)
+	for k in range(-theiler+1,theiler):
+		allPoints -= RP.diagonal(k).sum()
+
+	# get the line distibution, the theiler window is
+	# skipped by the line extractors
+	diagHist = getDiagLines(RP,theiler=theiler)
+	vertHist = getVertLines(RP,theiler=theiler)
+
+	return diagHist, vertHist, allPoints
+
+def stackHists(RPs,theiler=1):
+	"""
+	rpHists() of a stack of dense RPs of the same shape
+	(trials x rows x cols), all trials measured at once.
+	Returns the histogrammes as (trials x length) arrays
+	and the no. of recurrent points per trial.
+	"""
+
+	nRPs, nRows, nCols = RPs.shape
+
+	# diagonal offset of every point
+	k = arange(nCols)[newaxis,:] - arange(nRows)[:,newaxis]
+
+	if theiler > 0:
+		RPs = RPs & (absolute(k) >= theiler)
+
+	allPoints = RPs.sum(axis=2).sum(axis=1)
+
+	# diagonals as columns of one block per RP, as in getDiagLines()
+	k = arange(-nRows+1,nCols)
+	rows = arange(nRows)[:,newaxis]
+	cols = rows + k[newaxis,:]
+	block = RPs[:,rows,clip(cols,0,nCols-1)]
+	block &= (cols >= 0) & (cols < nCols)
+
+	width = int(maximum(nRows,nCols)) + 1
+	diagHist = labelHist(zeros( (nRPs,width), dtype=int64),[stackRuns(block)])
+	vertHist = labelHist(zeros( (nRPs,width), dtype=int64),[stackRuns(RPs)])
+
+	return diagHist, vertHist, allPoints
+
+def rqaMeasures(diagHist,vertHist,allPoints,size,lMin=2,vMin=2):
+	"""
+	Computes the complexity measures from the histogrammes 
+	of diagonal/vertical lines (index == line length), the 
+	no. of recurrent points and the size of the RP.
+	"""
+
 	#array to hold results
 	rqa = zeros(8)
-		
-	#theiler exclusion here please
-	if theiler > 0:
-		RP = triu(RP,theiler)+tril(RP,-theiler)
-	
-	# all recurrent points	
-	allPoints = sum(RP, dtype=float32)
 
-	# get the line distibution	
-	diagLines = getDiagLines(RP)
-	vertLines = getVertLines(RP)
+	# exclude lines that are too short
+	diagHist = asarray(diagHist,dtype=float64).copy()
+	vertHist = asarray(vertHist,dtype=float64).copy()
+	diagHist[:lMin] = 0
+	vertHist[:vMin] = 0
 
-	# and exclude lines that are too short
-	diagLines = diagLines[diagLines >= lMin]
-	vertLines = vertLines[vertLines >= vMin]
+	nDiag, nVert = diagHist.sum(), vertHist.sum()
+	lengths = arange(maximum(len(diagHist),len(vertHist)))
+	diagPoints = dot(lengths[:len(diagHist)],diagHist)
+	vertPoints = dot(lengths[:len(vertHist)],vertHist)
 	
 	# compute the complexity measures	
+	if allPoints == 0: return rqa
 	
 	# RR
-	rqa[0] = allPoints/RP.size
-	
+	rqa[0] = float(allPoints)/size
 
 	#DET 
-	rqa[1] = sum(diagLines) / allPoints	
+	rqa[1] = diagPoints / allPoints	
 	
 	# L und Lmax
-	rqa[2] = diagLines.mean()
-	rqa[3] = diagLines.max()
+	if nDiag > 0:
+		rqa[2] = diagPoints / nDiag
+		rqa[3] = flatnonzero(diagHist).max()
 	
-	#ENT
-	(p,h) =	histogram(diagLines,new=True)
-	rqa[4] = shannon(p/allPoints)
+		#ENT of the line length distribution
+		rqa[4] = shannon(diagHist/nDiag)
 	
 	#LAM 
- 	rqa[5] = sum(vertLines) / allPoints
+	rqa[5] = vertPoints / allPoints
 
 	# TT and Vmax
-	rqa[6] = vertLines.mean()
-	rqa[7] = vertLines.max()
-
+	if nVert > 0:
+		rqa[6] = vertPoints / nVert
+		rqa[7] = flatnonzero(vertHist).max()
 	
 	return rqa
-	
+
+def recurrenceTimeMeasures(whiteHist,diagPoints,shape,rqa,theiler=1):
+	"""
+	Computes the measures based on recurrence times from
+	the outputs of columnSweep() and the rqa of the RP:
+
+		rtm[0] = RPDE	recurrence period density entropy
+		rtm[1] = T	mean recurrence time (white line length)
+		rtm[2] = RATIO	DET/RR
+		rtm[3] = TREND	slope of the RR per diagonal over the
+				distance to the main diagonal
+
+	RPDE is the entropy of the white line lengths divided
+	by log2 of the longest one. TREND leaves out the theiler 
+	window and the TRENDCUT longest diagonals.
+	"""
+
+	rtm = zeros(4)
+	nRows, nCols = shape
+
+	nWhite = whiteHist.sum()
+	if nWhite > 0:
+		lengths = arange(len(whiteHist))
+		rtm[1] = dot(lengths,whiteHist) / float(nWhite)
+		if len(whiteHist) > 2:
+			rtm[0] = shannon(whiteHist/float(nWhite)) / log2(len(whiteHist)-1)
+
+	if rqa[0] > 0: rtm[2] = rqa[1] / rqa[0]
+
+	# recurrence rate per distance from the main diagonal
+	k = arange(-nRows+1,nCols)
+	diagLengths = minimum(nRows,nCols-k) - maximum(0,-k)
+	nDist = int(minimum(nRows,nCols)*(1-TRENDCUT))
+	points = bincount(absolute(k),weights=diagPoints)[:nDist]
+	cells = bincount(absolute(k),weights=diagLengths)[:nDist]
+
+	dist = arange(int(maximum(theiler,1)),nDist)
+	if len(dist) > 1:
+		rr = points[dist] / cells[dist]
+		d = dist - dist.mean()
+		rtm[3] = dot(d,rr-rr.mean()) / dot(d,d)
+
+	return rtm
+
+def addHist(hist,lines):
+	"""
+	Adds the line lengths in lines to histogramme hist 
+	and returns the (possibly longer) histogramme.
+	"""
+
+	if len(lines) == 0: return hist
+
+	new = bincount(lines)
+	if len(new) > len(hist): new, hist = hist, new
+	hist[:len(new)] += new
+
+	return hist
+
+def labelHist(hists,lines):
+	"""
+	Adds (row, length) pairs of lines in the list lines
+	to the rows of the 2D histogramme hists (in-place).
+	"""
+
+	if len(lines) == 0: return hists
+
+	rows = concatenate([l[0] for l in lines])
+	lengths = concatenate([l[1] for l in lines]).astype(int64)
+
+	width = hists.shape[1]
+	hists += bincount(rows*width+lengths,minlength=hists.size).reshape(hists.shape)
+
+	return hists
+
+def subHist(hist,lines):
+	"""
+	Removes the line lengths in lines from histogramme hist.
+	"""
+
+	if len(lines) == 0: return hist
+
+	old = bincount(lines)
+	hist[:len(old)] -= old
+
+	return hist
+
 def shannon(p):
  	"""
 	Compute Shannon entropy of random variable with probability p
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Recurrence network measures for the crpy module.
+	See crpy for details.
+
+	An RP (without its main diagonal) is the adjacency matrix
+	of an undirected network. Here that adjacency is kept in
+	CSR form (a sparseRP) and the measures work on the edge
+	lists: triangles are counted by looking up the wedges of
+	a block of nodes in the sorted edge keys, path lengths
+	come from breadth-first searches of a batch of sources
+	at once. Nothing of size N x N is ever allocated.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+from sparse import *
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def networkAdjacency(RP):
+	"""
+	Returns the adjacency matrix of the recurrence network
+	of RP (a sparseRP or a dense array) as sparseRP, that is
+	the RP without its main diagonal.
+	"""
+
+	if RP.shape[0] != RP.shape[1]:
+		raise ValueError,"Recurrence networks need a square RP"
+
+	if hasattr(RP,'indptr'):
+		rows, cols = RP.nonzero()
+	else:
+		rows, cols = asarray(RP).nonzero()
+
+	loop = rows == cols
+	if not loop.any() and hasattr(RP,'indptr'): return RP
+
+	return makeSparseRP(rows[~loop],cols[~loop],RP.shape)
+
+def nodeDegrees(A):
+	"""
+	Returns the no. of neighbours of every node.
+	"""
+
+	return diff(A.indptr)
+
+def edgeKeys(A):
+	"""
+	Returns row*N + column of all edges, which is sorted
+	as the columns are sorted per row.
+	"""
+
+	rows, cols = A.nonzero()
+	return rows*int64(A.shape[1]) + cols
+
+def nodeTriangles(A):
+	"""
+	Returns the no. of triangles every node is part of.
+
+	Each triangle u < w < x is found once, from the edge
+	(u,w) and the edge (w,x), if u*N+x is an edge key. These
+	wedges are built for a block of edges at a time, about
+	BATCHCELLS of them, and looked up with searchsorted,
+	i.e. the diagonal of A*A*A row block by row block.
+	"""
+
+	N = A.shape[0]
+	rows, cols = A.nonzero()
+	keys = edgeKeys(A)
+
+	# the neighbours x > w of node w are the end of its row
+	up = cols > rows
+	above = bincount(rows[up],minlength=N)
+	first = A.indptr[1:] - above
+	rows, cols = rows[up], cols[up]
+
+	# wedges per edge (u,w), edges are cut into blocks of
+	# about BATCHCELLS wedges
+	counts = above[cols]
+	ends = cumsum(counts)
+	bounds = searchsorted(ends,arange(BATCHCELLS,ends[-1] if len(ends) else 0,BATCHCELLS))
+	bounds = unique(concatenate( ([0],bounds,[len(cols)]) ))
+
+	triangles = zeros(N,dtype=int64)
+
+	for e0,e1 in zip(bounds[:-1],bounds[1:]):
+
+		c = counts[e0:e1]
+		total = c.sum()
+		if total == 0: continue
+
+		# x runs over the row of w from first[w] on
+		offset = repeat(first[cols[e0:e1]] - (cumsum(c)-c),c)
+		x = A.indices[offset + arange(total)]
+		u = repeat(rows[e0:e1],c)
+		w = repeat(cols[e0:e1],c)
+
+		wanted = u*int64(N) + x
+		pos = minimum(searchsorted(keys,wanted),len(keys)-1)
+		hit = keys[pos] == wanted
+
+		for corner in (u,w,x):
+			triangles += bincount(corner[hit],minlength=N)
+
+	return triangles
+
+def localClustering(A,triangles=None):
+	"""
+	Returns the local clustering coefficient of every node:
+	the fraction of pairs of its neighbours that are linked
+	(0 for nodes with less than 2 neighbours). Pass the
+	nodeTriangles() if they are known already.
+	"""
+
+	if triangles is None: triangles = nodeTriangles(A)
+
+	deg = nodeDegrees(A)
+	pairs = deg*(deg-1) / 2.
+
+	return triangles / maximum(pairs,1)
+
+def transitivity(A,triangles=None):
+	"""
+	Returns the global clustering: the fraction of connected
+	triples of nodes that are closed to a triangle. Pass the
+	nodeTriangles() if they are known already.
+	"""
+
+	deg = nodeDegrees(A)
+	pairs = (deg*(deg-1) / 2.).sum()
+	if pairs == 0: return 0.
+
+	if triangles is None: triangles = nodeTriangles(A)
+
+	return triangles.sum() / pairs
+
+def bfsLengths(A,sources):
+	"""
+	Breadth-first search from all sources at once. Returns
+	the sum of the shortest path lengths to all reachable
+	nodes and the no. of those nodes (both per source).
+
+	The searches share one (sources x N) visited map, the
+	frontier is a list of source*N + node keys that is
+	expanded along the CSR rows each step.
+	"""
+
+	N = A.shape[0]
+	B = len(sources)
+
+	visited = zeros(B*N,dtype=bool)
+	frontier = arange(B)*int64(N) + sources
+	visited[frontier] = True
+
+	lengths = zeros(B,dtype=int64)
+	reached = zeros(B,dtype=int64)
+	step = 0
+
+	while len(frontier):
+
+		step += 1
+		b, u = divmod(frontier,N)
+
+		# all neighbours of the frontier nodes
+		c = A.indptr[u+1] - A.indptr[u]
+		total = c.sum()
+		offset = repeat(A.indptr[u] - (cumsum(c)-c),c)
+		nodes = repeat(b*int64(N),c) + A.indices[offset + arange(total)]
+
+		frontier = unique(nodes[~visited[nodes]])
+		visited[frontier] = True
+
+		found = bincount(frontier // N,minlength=B)
+		lengths += step*found
+		reached += found
+
+	return lengths, reached
+
+def pathLength(A,nSources=None,seed=0):
+	"""
+	Returns the average shortest path length between all
+	pairs of connected nodes (pairs in different components
+	are left out, nan if there are no edges).
+
+	The BFS runs from every node, about BATCHCELLS/N sources
+	at a time. That is O(N*edges), for large networks pass
+	nSources to average over that many random sources only.
+	"""
+
+	N = A.shape[0]
+
+	if nSources is None or nSources >= N:
+		sources = arange(N)
+	else:
+		sources = random.RandomState(seed).permutation(N)[:nSources]
+
+	batch = int(maximum(1,BATCHCELLS // maximum(N,1)))
+
+	lengths, reached = 0, 0
+	for s0 in range(0,len(sources),batch):
+		l, r = bfsLengths(A,sources[s0:s0+batch])
+		lengths += l.sum(); reached += r.sum()
+
+	if reached == 0: return nan
+
+	return lengths / float(reached)
+
+def networkMeasures(RP,nSources=None,seed=0):
+	"""
+	Returns degree and local clustering (per node), the
+	transitivity and the average path length of the
+	recurrence network of RP (a sparseRP or a dense array,
+	see networkAdjacency).
+	"""
+
+	A = networkAdjacency(RP)
+	triangles = nodeTriangles(A)
+
+	return (nodeDegrees(A), localClustering(A,triangles), transitivity(A,triangles),
+		pathLength(A,nSources,seed))
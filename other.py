@@ -40,12 +40,39 @@ from helper import *
 """
 
 
-def makeDistMatrix(X,Y,dim,tau,norm='max',normalise=True):
+def makeDistMatrix(X,Y,dim,tau,norm='max',normalise=True,tileSize=TILESIZE,filename=None):
 	"""
 	Computes the chosen distance between all
 	points in X and Y and returnes a distance matrix
 	to the caller. The data is embedded prior. Multi-
-	column input is not yet supported. 
+	column input (T x channels) is supported. The matrix is
+	filled tile by tile, see makeDistMatrixLoop() for
+	the column-wise reference implementation. For an
+	empty Y the data is embedded once and only the
+	upper triangle is computed.
+
+	With a filename the matrix is written to that .npy
+	file (numpy.memmap) and never held in memory as a
+	whole, for series too long for RAM.
+	"""	
+
+	# normalise & embed
+	Xemb,Yemb = prepareData(X,Y,dim,tau,normalise)
+	lenEmbData = len(Xemb)
+	
+	# alloc memory for output matrix
+	distMatrix = allocMatrix( (lenEmbData,lenEmbData), float32, filename)
+
+	fillTiles(distMatrix,Xemb,Yemb,norm,None,tileSize)
+	if filename is not None: distMatrix.flush()
+
+	#return to caller
+	return distMatrix
+
+def makeDistMatrixLoop(X,Y,dim,tau,norm='max',normalise=True):
+	"""
+	Reference implementation of makeDistMatrix(), 
+	computes the matrix one column at a time.
 	"""	
 
 	# RP/CRP switch	
@@ -73,16 +100,24 @@ def makeDistMatrix(X,Y,dim,tau,norm='max',normalise=True):
 		if norm == 'max':	
 		
 			diff = Yemb - matlib.repmat(Xemb[i],lenEmbData,1)				
-			distMatrix[:,i] = 	abs(diff.max(axis = 1))		
+			distMatrix[:,i] = 	abs(diff).max(axis = 1)
 			
 		elif norm == 'min':
 
 			diff = Yemb - matlib.repmat(Xemb[i],lenEmbData,1)			
 			distMatrix[:,i] = 	abs(diff.min(axis = 1))
 
+		elif norm == 'l1':
+
+			distMatrix[:,i] = abs(Yemb - Xemb[i]).sum(axis = 1)
+
+		elif norm == 'euclidean':
+
+			distMatrix[:,i] = sqrt(((Yemb - Xemb[i])**2).sum(axis = 1))
+
 		else:
 
-			raise Exception,"Only maximum and minimum norm supported now"
+			raise Exception,"Only maximum, minimum, euclidean and l1 norm supported now"
 
 	#return to caller
-	return distMatrix
\ No newline at end of file
+	return distMatrix
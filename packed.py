@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Bit-packed recurrence plots for the crpy module.
+	See crpy for details.
+
+	An RP only holds zeros and ones, so every row is stored
+	as numpy.packbits() output (8 points per byte). The line
+	distributions are computed on the packed words directly,
+	so the RP never needs to be unpacked as a whole.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+
+# no. of set bits for every possible byte value
+POPCOUNT = array([bin(i).count('1') for i in range(256)], dtype=uint8)
+
+##################################
+##  	Packed RP class			##
+##################################
+
+class packedRP:
+	"""
+	A recurrence plot with every row stored as packbits()
+	output. Row j, column i is bit 7-(i%8) of bits[j,i/8].
+	"""
+
+	def __init__(self,bits,nCols):
+		"""
+		Wraps an existing (nRows x ceil(nCols/8)) uint8 array.
+		"""
+
+		self.bits = bits
+		self.shape = (bits.shape[0],nCols)
+		self.size = self.shape[0]*self.shape[1]
+
+	def toarray(self):
+		"""
+		Returns the RP as dense int8 matrix.
+		"""
+
+		return unpackbits(self.bits,axis=1)[:,:self.shape[1]].view(int8)
+
+	def sum(self):
+		"""
+		Returns the no. of recurrent points.
+		"""
+
+		return int(POPCOUNT[self.bits].sum(dtype=int64))
+
+	def rowBlocks(self,blockRows=None):
+		"""
+		Generates (firstRow, packed rows) blocks of the RP.
+		"""
+
+		if blockRows is None: blockRows = packedBlockRows(self.shape[1])
+
+		for r0 in range(0,self.shape[0],blockRows):
+			yield r0, self.bits[r0:r0+blockRows]
+
+	def lineHists(self,theiler=0):
+		"""
+		Returns the histogrammes of diagonal and vertical lines
+		and the no. of recurrent points. Points closer than
+		theiler to the main diagonal are ignored.
+		"""
+
+		return packedLineHists(self.rowBlocks(),self.shape,theiler)
+
+	def diagHist(self,theiler=0):
+		return self.lineHists(theiler)[0]
+
+	def vertHist(self,theiler=0):
+		return self.lineHists(theiler)[1]
+
+
+class packedTriRP:
+	"""
+	The upper triangle (main diagonal included) of a
+	symmetric RP in packed form. Row j only keeps the bytes
+	from column j on, stored one after the other in bits
+	starting at offsets[j]. Bits left of the main diagonal
+	are zero.
+	"""
+
+	def __init__(self,bits,nPoints):
+		"""
+		Wraps an existing flat uint8 array.
+		"""
+
+		self.bits = bits
+		self.offsets = triOffsets(nPoints)
+		self.shape = (nPoints,nPoints)
+		self.size = nPoints*nPoints
+
+	def rowBlocks(self,blockRows=None):
+		"""
+		Generates (firstRow, packed rows) blocks of the upper
+		triangle as full width rows.
+		"""
+
+		nPoints = self.shape[0]
+		nBytes = (nPoints+7) // 8
+		if blockRows is None: blockRows = packedBlockRows(nPoints)
+
+		for r0 in range(0,nPoints,blockRows):
+			rows = arange(r0,minimum(r0+blockRows,nPoints))
+			idx, stored = triIndex(self.offsets,rows,0,nBytes)
+			block = zeros( (len(rows),nBytes), dtype=uint8)
+			block[stored] = self.bits[idx[stored]]
+			yield r0, block
+
+	def diagonal(self):
+		"""
+		Returns the main diagonal as bool vector.
+		"""
+
+		rows = arange(self.shape[0])
+		return ((self.bits[self.offsets[:-1]] >> (7 - rows % 8)) & 1).astype(bool)
+
+	def toarray(self):
+		"""
+		Returns the full RP as dense int8 matrix.
+		"""
+
+		upper = concatenate( [unpackbits(b,axis=1) for r0,b in self.rowBlocks()] )
+		upper = upper[:,:self.shape[1]].view(int8)
+		return upper | upper.T
+
+	def sum(self):
+		"""
+		Returns the no. of recurrent points.
+		"""
+
+		return 2*int(POPCOUNT[self.bits].sum(dtype=int64)) - count_nonzero(self.diagonal())
+
+	def lineHists(self,theiler=0):
+		"""
+		Returns the histogrammes of diagonal and vertical lines
+		and the no. of recurrent points. Points closer than
+		theiler to the main diagonal are ignored.
+		"""
+
+		return packedLineHists(self.rowBlocks(),self.shape,theiler,symmetric=True)
+
+	def diagHist(self,theiler=0):
+		return self.lineHists(theiler)[0]
+
+	def vertHist(self,theiler=0):
+		return self.lineHists(theiler)[1]
+
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def packRP(RP):
+	"""
+	Converts a dense RP to a packedRP.
+	"""
+
+	RP = asarray(RP)
+
+	return packedRP(packbits(RP != 0,axis=1),RP.shape[1])
+
+def mappedRowBlocks(RP,blockRows=None):
+	"""
+	Generates (firstRow, packed rows) blocks of a dense RP,
+	reading about TILESIZE**2 points at a time. Meant for
+	RPs in memory mapped files.
+	"""
+
+	if blockRows is None: blockRows = int(maximum(1,TILESIZE**2 // RP.shape[1]))
+
+	for r0 in range(0,RP.shape[0],blockRows):
+		yield r0, packbits(asarray(RP[r0:r0+blockRows]) != 0,axis=1)
+
+def packSparse(RP):
+	"""
+	Converts a sparseRP to a packedRP without going through
+	a dense matrix.
+	"""
+
+	rows, cols = RP.nonzero()
+	nBytes = (RP.shape[1]+7) // 8
+	bits = zeros( (RP.shape[0],nBytes), dtype=uint8)
+	if len(cols) == 0: return packedRP(bits,RP.shape[1])
+
+	# columns are sorted per row, so points sharing a byte are adjacent
+	idx = rows*nBytes + cols // 8
+	vals = (128 >> (cols % 8)).astype(uint8)
+	starts = flatnonzero(concatenate( ([True],diff(idx) != 0) ))
+	bits.ravel()[idx[starts]] = bitwise_or.reduceat(vals,starts)
+
+	return packedRP(bits,RP.shape[1])
+
+def packedBlockRows(nCols):
+	"""
+	No. of packed rows to process at once, such that a block
+	holds about TILESIZE**2 bytes.
+	"""
+
+	return int(maximum(1,TILESIZE**2 // (nCols // 8 + 2)))
+
+def packedTiles(Xemb,Yemb,eps,norm='max',tileSize=TILESIZE,theiler=0):
+	"""
+	Computes a packed (C)RP tile by tile. The tile width is
+	rounded up to a multiple of 8, so every tile maps to whole
+	bytes of the packed rows. Points closer than theiler to
+	the main diagonal are left out.
+	"""
+
+	nRows, nCols = len(Yemb), len(Xemb)
+	tileSize = (tileSize+7) // 8 * 8
+
+	bits = zeros( (nRows,(nCols+7) // 8), dtype=uint8)
+
+	for rows,cols in tileSlices(nRows,nCols,tileSize,theiler=theiler):
+		tile = clearTheiler(recTile(Xemb[cols],Yemb[rows],eps,norm),
+			rows.start,cols.start,theiler)
+		tile = packbits(tile,axis=1)
+		b0 = cols.start // 8
+		bits[rows,b0:b0+tile.shape[1]] = tile
+
+	return packedRP(bits,nCols)
+
+def packedTriTiles(Xemb,eps,norm='max',tileSize=TILESIZE,theiler=0):
+	"""
+	Computes the packedTriRP of Xemb. Only the tiles on and
+	above the main diagonal are computed, points closer than
+	theiler to it are left out.
+	"""
+
+	nPoints = len(Xemb)
+	tileSize = (tileSize+7) // 8 * 8
+
+	offsets = triOffsets(nPoints)
+	bits = zeros(offsets[-1],dtype=uint8)
+
+	for rows,cols in tileSlices(nPoints,nPoints,tileSize,True,theiler):
+
+		tile = clearTheiler(recTile(Xemb[cols],Xemb[rows],eps,norm),
+			rows.start,cols.start,theiler)
+		if rows == cols: tile = triu(tile)
+
+		tile = packbits(tile,axis=1)
+		r = arange(rows.start,rows.start+tile.shape[0])
+		idx, stored = triIndex(offsets,r,cols.start // 8,tile.shape[1])
+		bits[idx[stored]] = tile[stored]
+
+	return packedTriRP(bits,nPoints)
+
+def triOffsets(nPoints):
+	"""
+	Start of every row in the flat storage of a packedTriRP,
+	plus the total no. of bytes at the end.
+	"""
+
+	nBytes = (nPoints+7) // 8
+	offsets = zeros(nPoints+1,dtype=int64)
+	offsets[1:] = cumsum(nBytes - arange(nPoints) // 8)
+
+	return offsets
+
+def triIndex(offsets,rows,b0,nBytes):
+	"""
+	Flat indices of bytes b0 ... b0+nBytes-1 of the given
+	rows of a packedTriRP, and which of them are stored.
+	"""
+
+	b = arange(b0,b0+nBytes)[newaxis,:] - (rows // 8)[:,newaxis]
+
+	return offsets[rows][:,newaxis] + b, b >= 0
+
+def maskPackedTheiler(block,r0,nCols,theiler):
+	"""
+	Clears all points closer than theiler to the main
+	diagonal in a block of packed rows starting at row r0.
+	Only the bytes touching the excluded band are unpacked.
+	"""
+
+	nRows = len(block)
+
+	# bytes covering the band of this block
+	b0 = int(maximum(0,r0-theiler+1)) // 8
+	b1 = int(minimum(nCols,r0+nRows+theiler-1) + 7) // 8
+	if b1 <= b0: return block
+
+	sub = unpackbits(block[:,b0:b1],axis=1)
+	rows = arange(r0,r0+nRows)[:,newaxis]
+	cols = arange(b0*8,b1*8)[newaxis,:]
+	sub[absolute(cols-rows) < theiler] = 0
+
+	block[:,b0:b1] = packbits(sub,axis=1)
+	return block
+
+def setBits(mask):
+	"""
+	Returns (row, column) of all set bits in a packed 2D mask.
+	Only non-zero bytes get unpacked.
+	"""
+
+	nBytes = mask.shape[1]
+	idx = flatnonzero(mask)
+	bits = unpackbits(mask.ravel()[idx][:,newaxis],axis=1)
+	byte, bit = nonzero(bits)
+	pos = idx[byte]*8 + bit
+
+	return pos // (nBytes*8), pos % (nBytes*8)
+
+def pairRuns(keys,rows,isEnd):
+	"""
+	Matches line starts and ends. Per key the events must
+	alternate start/end when sorted by row. Returns the line
+	lengths, the (keys,rows) of their end events and the
+	(keys,rows) of the starts left open.
+	"""
+
+	order = lexsort( (rows,keys) )
+	keys, rows, isEnd = keys[order], rows[order], isEnd[order]
+
+	# every end closes the start right before it
+	ends = flatnonzero(isEnd)
+	lengths = rows[ends] - rows[ends-1]
+
+	isOpen = ~isEnd
+	isOpen[ends-1] = False
+
+	return lengths, keys[ends], rows[ends], keys[isOpen], rows[isOpen]
+
+def packedLineHists(blocks,shape,theiler=0,symmetric=False):
+	"""
+	Sweeps over blocks of packed rows and returns the
+	histogrammes of diagonal and vertical lines plus the
+	no. of recurrent points.
+
+	Line starts and ends are found on the packed words:
+	a vertical line starts where a bit is set but the bit
+	above is not, a diagonal one where the bit up-left is
+	not set (the previous row shifted by one bit). Runs that
+	are still open at the end of a block are carried over.
+
+	symmetric=True means blocks only hold the upper triangle
+	of a symmetric RP (main diagonal included). The diagonal
+	lines above the main diagonal then count twice and the
+	vertical lines below it are the horizontal lines of the
+	rows, found the same way within each row.
+	"""
+
+	nRows, nCols = shape
+	nBytes = (nCols+7) // 8
+
+	# the main diagonal is handled separately
+	mask = int(maximum(theiler,1)) if symmetric else theiler
+
+	# previous row with one spare byte for the diagonal shift
+	prev = zeros( (1,nBytes+1), dtype=uint8)
+	vOpen = (zeros(0,dtype=int64),zeros(0,dtype=int64))
+	dOpen = (zeros(0,dtype=int64),zeros(0,dtype=int64))
+	diagHist = zeros(1,dtype=int64)
+	vertHist = zeros(1,dtype=int64)
+	nRec = 0
+
+	# main diagonal and the lines right above/right of it
+	main = zeros(nRows,dtype=bool)
+	above = zeros(nCols,dtype=int64)
+	right = zeros(nRows,dtype=int64)
+
+	# a trailing zero row closes all open lines
+	def withEnd(blocks):
+		for r0,block in blocks: yield r0,block
+		yield nRows, zeros( (1,nBytes), dtype=uint8)
+
+	for r0,block in withEnd(blocks):
+
+		cur = zeros( (len(block),nBytes+1), dtype=uint8)
+		cur[:,:nBytes] = block
+		rows = arange(r0,r0+len(block))
+		if symmetric and r0 < nRows:
+			main[rows] = (cur[rows-r0,rows // 8] >> (7 - rows % 8)) & 1
+		if mask > 0:
+			cur[:,:nBytes] = maskPackedTheiler(cur[:,:nBytes],r0,nCols,mask)
+		nRec += int(POPCOUNT[cur].sum(dtype=int64))
+
+		up = vstack( (prev,cur[:-1]) )
+
+		# previous row moved one column to the right
+		upLeft = shiftRight(up)
+
+		# vertical lines, key is the column
+		lines, keys, ends, vOpen = packedEvents(cur & ~up, up & ~cur, r0, vOpen, 0)
+		vertHist = addHist(vertHist,lines)
+
+		# lines ending right above the main diagonal
+		if symmetric:
+			at = keys == ends
+			above[keys[at]] = lines[at]
+
+		# diagonal lines, key is the offset column-row
+		lines, keys, ends, dOpen = packedEvents(cur & ~upLeft, upLeft & ~cur, r0, dOpen, 1)
+		diagHist = addHist(diagHist,lines)
+
+		# horizontal lines, key is the row
+		if symmetric and r0 < nRows:
+			left = shiftRight(cur)
+			sRows, sCols = setBits(cur & ~left)
+			eRows, eCols = setBits(left & ~cur)
+			lines, keys, ends = pairRuns(concatenate( (sRows,eRows) ),
+				concatenate( (sCols,eCols) ),
+				concatenate( (zeros(len(sRows),dtype=bool),ones(len(eRows),dtype=bool)) ))[:3]
+			vertHist = addHist(vertHist,lines)
+
+			# lines starting right of the main diagonal
+			at = ends-lines == keys+r0+1
+			right[keys[at]+r0] = lines[at]
+
+		prev = cur[-1:]
+
+	if symmetric:
+		diagHist *= 2
+		nRec *= 2
+		if theiler == 0:
+			nRec += count_nonzero(main)
+			diagHist = addHist(diagHist,maxConsElements(main).ravel())
+			vertHist = joinMainDiagonal(vertHist,main,above,right)
+
+	return diagHist, vertHist, nRec
+
+def shiftRight(rows):
+	"""
+	Moves every packed row one bit (column) to the right.
+	"""
+
+	moved = rows >> 1
+	moved[:,1:] |= (rows[:,:-1] & 1) << 7
+
+	return moved
+
+def packedEvents(starts,ends,r0,carry,diagonal):
+	"""
+	Converts packed start/end masks of a block to line
+	lengths, using and updating the open lines in carry.
+	Also returns key and row of the end event of each line.
+	"""
+
+	sRows, sCols = setBits(starts)
+	eRows, eCols = setBits(ends)
+	sRows += r0; eRows += r0
+
+	if diagonal:
+		sKeys, eKeys = sCols - sRows, eCols - eRows
+	else:
+		sKeys, eKeys = sCols, eCols
+
+	keys = concatenate( (carry[0],sKeys,eKeys) )
+	rows = concatenate( (carry[1],sRows,eRows) )
+	isEnd = concatenate( (zeros(len(carry[0])+len(sKeys),dtype=bool),
+		ones(len(eKeys),dtype=bool)) )
+
+	lengths, endKeys, endRows, openKeys, openRows = pairRuns(keys,rows,isEnd)
+
+	return lengths, endKeys, endRows, (openKeys,openRows)
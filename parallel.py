@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Process pool execution for the crpy module.
+	See crpy for details.
+
+	The input data is put into shared memory once and mapped
+	by every worker process, so only window/series numbers
+	and parameters get pickled. Results come back in task
+	order.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+from windowed import *
+from bootstrap import *
+from surrogates import *
+import ctypes
+import multiprocessing
+from multiprocessing import sharedctypes
+
+# the shared arrays as seen by the current process, see initWorker()
+sharedData = {}
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def toShared(a):
+	"""
+	Copies array a into shared memory. Returns what the
+	workers need to map it again: (buffer, dtype, shape).
+	"""
+
+	a = ascontiguousarray(a)
+	raw = sharedctypes.RawArray(ctypes.c_byte,int(maximum(a.nbytes,1)))
+	frombuffer(raw,dtype=a.dtype,count=a.size)[:] = a.ravel()
+
+	return raw, a.dtype.str, a.shape
+
+def initWorker(shared):
+	"""
+	Maps the shared arrays (name -> toShared() output)
+	into sharedData. Runs once per worker process.
+	"""
+
+	sharedData.clear()
+	for name,(raw,dtype,shape) in shared.items():
+		a = frombuffer(raw,dtype=dtype,count=int(prod(shape)))
+		sharedData[name] = a.reshape(shape)
+
+def runTasks(func,tasks,shared,nProcs=1):
+	"""
+	Runs func(task) for all tasks on a pool of nProcs
+	processes with the arrays in shared (name -> array)
+	available as sharedData. Returns the results in
+	task order. nProcs=1 runs in this process.
+	"""
+
+	shared = dict( (name,toShared(a)) for name,a in shared.items() )
+
+	if nProcs <= 1:
+		initWorker(shared)
+		try:
+			return map(func,tasks)
+		finally:
+			sharedData.clear()
+
+	pool = multiprocessing.Pool(nProcs,initWorker,(shared,))
+	try:
+		return pool.map(func,tasks,chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+
+def splitRange(n,nParts):
+	"""
+	Splits range(n) into at most nParts contiguous
+	(first, count) chunks.
+	"""
+
+	bounds = unique(linspace(0,n,nParts+1).astype(int64))
+
+	return [(int(a),int(b-a)) for a,b in zip(bounds[:-1],bounds[1:])]
+
+def windowTask(task):
+	"""
+	Worker: windows first ... first+count-1 of the shared
+	data, see slidingWindows(). The data is embedded here,
+	which only creates views.
+	"""
+
+	first, count, params = task
+	dim, tau, eps, window, step, norm, theiler, lMin, vMin = params
+
+	Xemb = embedData(sharedData['X'],dim,tau)
+	Yemb = embedData(sharedData['Y'],dim,tau) if 'Y' in sharedData else Xemb
+
+	return slidingWindows(Xemb,Yemb,eps,window,step,
+		first,count,norm,theiler,lMin,vMin)
+
+def batchTask(task):
+	"""
+	Worker: crqa of the trials first ... first+count-1 of
+	the shared batch, see bcrqa().
+	"""
+
+	# lives in the core module, which imports this one
+	from crpy import trialStacks, stackRQA
+
+	first, count, params = task
+
+	bounds = sharedData['bounds']
+	series = lambda a: [a[bounds[i]:bounds[i+1]] for i in range(first,first+count)]
+
+	Xs = series(sharedData['X'])
+	Ys = series(sharedData['Y']) if 'Y' in sharedData else None
+
+	return vstack([stackRQA(X,Y,params) for X,Y in trialStacks(Xs,Ys)])
+
+def bootTask(task):
+	"""
+	Worker: one block of bootstrap replicates of the shared
+	line histogrammes, see bootstrapRQAMeasures().
+	"""
+
+	nBoot, lMin, vMin, seed = task
+
+	diag = (sharedData['diagLengths'],sharedData['diagCounts'])
+	vert = (sharedData['vertLengths'],sharedData['vertCounts'])
+
+	return bootBlock(diag,vert,nBoot,lMin,vMin,seed)
+
+def surrogateTask(task):
+	"""
+	Worker: makes batch no. b of surrogates of the shared
+	(normalised) X and returns their rqa rows. The embedding
+	of Y is a view of the shared Y, for RPs each surrogate
+	is compared with itself.
+	"""
+
+	# lives in the core module, which imports this one
+	from crpy import embeddedHists
+
+	b, count, params = task
+	dim, tau, eps, norm, theiler, lMin, vMin, method, surrogate, seed = params
+
+	Yemb = embedData(sharedData['Y'],dim,tau) if 'Y' in sharedData else None
+
+	rqa = zeros( (count,8) )
+	for n,S in enumerate(makeSurrogates(sharedData['X'],count,surrogate,(seed,b))):
+		Semb = embedData(S,dim,tau)
+		diagHist,vertHist,allPoints,size = embeddedHists(Semb,Semb if Yemb is None else Yemb,
+			eps,norm,theiler,method)
+		rqa[n] = rqaMeasures(diagHist,vertHist,allPoints,size,lMin,vMin)
+
+	return rqa
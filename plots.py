@@ -54,6 +54,9 @@ def showDistMatrix(distMatrix):
 
 def showRP(RP):
 
+	# packed RPs have to be expanded for plotting
+	if hasattr(RP,'toarray'): RP = RP.toarray()
+
 	pylab.matshow(- RP)
  	ax = pylab.gca() 
  	bottom, top = ax.get_ylim()
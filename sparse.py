@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Sparse recurrence plots for the crpy module.
+	See crpy for details.
+
+	For low recurrence rates most of an RP is empty. Here
+	the recurrent pairs are found with a grid of cells of
+	size eps (not for the minimum norm), so only neighbouring cells are
+	compared and the work scales with the no. of recurrences
+	rather than N^2. The RP is kept in CSR form.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+import itertools
+
+# no. of coordinates used for the grid, 3**GRIDDIM neighbour cells
+GRIDDIM = 3
+
+##################################
+##  	Sparse RP class			##
+##################################
+
+class sparseRP:
+	"""
+	A recurrence plot in compressed sparse row (CSR) form:
+	the columns of the recurrent points in row j are
+	indices[indptr[j]:indptr[j+1]], sorted ascending.
+	"""
+
+	def __init__(self,indptr,indices,shape):
+		"""
+		Wraps existing CSR arrays.
+		"""
+
+		self.indptr = indptr
+		self.indices = indices
+		self.shape = shape
+		self.size = shape[0]*shape[1]
+
+	def nonzero(self):
+		"""
+		Returns (rows, columns) of all recurrent points (COO).
+		"""
+
+		rows = repeat(arange(self.shape[0]),diff(self.indptr))
+		return rows, self.indices
+
+	def sum(self):
+		"""
+		Returns the no. of recurrent points.
+		"""
+
+		return len(self.indices)
+
+	def toarray(self):
+		"""
+		Returns the RP as dense int8 matrix.
+		"""
+
+		RP = zeros(self.shape,dtype=int8)
+		RP[self.nonzero()] = 1
+		return RP
+
+	def tocsr(self):
+		"""
+		Returns the RP as scipy.sparse.csr_matrix.
+		"""
+
+		try:
+			from scipy import sparse
+		except ImportError:
+			raise ImportError,"scipy is needed for tocsr()"
+
+		data = ones(len(self.indices),dtype=int8)
+		return sparse.csr_matrix( (data,self.indices,self.indptr), shape=self.shape)
+
+	def lineHists(self,theiler=0):
+		"""
+		Returns the histogrammes of diagonal and vertical lines
+		and the no. of recurrent points. Points closer than
+		theiler to the main diagonal are ignored.
+		"""
+
+		rows, cols = self.nonzero()
+
+		if theiler > 0:
+			keep = absolute(cols-rows) >= theiler
+			rows, cols = rows[keep], cols[keep]
+
+		# diagonal lines run along rows with constant offset,
+		# vertical lines along rows with constant column
+		diagHist = bincount(sortedRuns(cols-rows,rows))
+		vertHist = bincount(sortedRuns(cols,rows))
+
+		return diagHist, vertHist, len(rows)
+
+	def diagHist(self,theiler=0):
+		return self.lineHists(theiler)[0]
+
+	def vertHist(self,theiler=0):
+		return self.lineHists(theiler)[1]
+
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def sortedRuns(keys,pos):
+	"""
+	Returns the lengths of all runs of consecutive positions
+	pos that share the same key.
+	"""
+
+	if len(keys) == 0: return zeros(0,dtype=int64)
+
+	order = lexsort( (pos,keys) )
+	keys, pos = keys[order], pos[order]
+
+	# a new run starts where the key changes or a position is skipped
+	brk = (diff(keys) != 0) | (diff(pos) != 1)
+	starts = flatnonzero(concatenate( ([True],brk) ))
+
+	return diff(append(starts,len(keys)))
+
+def gridLevels(cells):
+	"""
+	Numbers the distinct occupied cells 0 ... nCells-1, one
+	coordinate at a time: the cell so far and the rank of the
+	next coordinate among the occupied ones are combined and
+	renumbered. Returns the keys of cells and the levels 
+	(coordinates, combined keys) gridKeys() needs to number 
+	other cells the same way. Keys stay below N^2, however
+	large the bounding box of the grid is.
+	"""
+
+	keys = zeros(len(cells),dtype=int64)
+	levels = []
+
+	for d in range(cells.shape[1]):
+		coords = unique(cells[:,d])
+		combined = keys*len(coords) + searchsorted(coords,cells[:,d])
+		known = unique(combined)
+		keys = searchsorted(known,combined)
+		levels.append( (coords,known) )
+
+	return keys, levels
+
+def gridKeys(cells,levels):
+	"""
+	Keys of cells as numbered by gridLevels(), -1 for cells
+	that are not occupied.
+	"""
+
+	keys = zeros(len(cells),dtype=int64)
+	valid = ones(len(cells),dtype=bool)
+
+	for d,(coords,known) in enumerate(levels):
+		pos = minimum(searchsorted(coords,cells[:,d]),len(coords)-1)
+		valid &= coords[pos] == cells[:,d]
+		combined = keys*len(coords) + pos
+		keys = minimum(searchsorted(known,combined),len(known)-1)
+		valid &= known[keys] == combined
+
+	return where(valid,keys,-1)
+
+def neighbourPairs(Xemb,Yemb,eps,norm='max',tileSize=TILESIZE,theiler=0):
+	"""
+	Finds all pairs (j,i) with a distance between Yemb[j] and
+	Xemb[i] below eps. Points are binned into cells of size
+	eps on the first GRIDDIM coordinates. Under the maximum,
+	euclidean and l1 norm neighbours can only be in the same
+	or adjacent cells, so only those candidates get their
+	distance computed. Pairs with |i-j| < theiler are skipped.
+	"""
+
+	# max|x-y| <= |x-y|_2 <= |x-y|_1
+	if norm not in ('max','euclidean','l1'):
+		raise ValueError,"Sparse RPs need the maximum, euclidean or l1 norm"
+
+	# cells a bit larger than eps, so rounding can never push
+	# two neighbours more than one cell apart. Cell coordinates
+	# stay floats, for tiny eps they do not fit an int64
+	nGrid = int(minimum(GRIDDIM,Xemb.shape[1]))
+	cell = eps*(1+1e-6)
+	cx = floor(Xemb[:,:nGrid].astype(float64)/cell)
+	cy = floor(Yemb[:,:nGrid].astype(float64)/cell)
+
+	# Y sorted by cell, neighbours are looked up per cell,
+	# only the cells holding points of Y get a key
+	keyY, levels = gridLevels(cy)
+	orderY = argsort(keyY,kind='mergesort')
+	keyY = keyY[orderY]
+
+	rows, cols = [], []
+
+	for c0 in range(0,len(Xemb),tileSize):
+
+		cxBlock = cx[c0:c0+tileSize]
+
+		for offset in itertools.product( (-1,0,1), repeat=nGrid):
+
+			shifted = cxBlock+array(offset)
+			keyX = gridKeys(shifted,levels)
+
+			# far out +-1 is lost in rounding, the cell would
+			# be visited twice
+			moved = array(offset) != 0
+			keyX[(shifted == cxBlock)[:,moved].any(axis=1)] = -1
+			left = searchsorted(keyY,keyX,'left')
+			counts = searchsorted(keyY,keyX,'right') - left
+
+			total = counts.sum()
+			if total == 0: continue
+
+			# expand all candidate pairs of this offset
+			xi = repeat(arange(c0,c0+len(cxBlock)),counts)
+			first = repeat(left - (cumsum(counts)-counts),counts)
+			yj = orderY[first + arange(total)]
+
+			if theiler > 0:
+				far = absolute(xi-yj) >= theiler
+				xi, yj = xi[far], yj[far]
+
+			hit = pairRec(Xemb[xi],Yemb[yj],eps,norm)
+			rows.append(yj[hit]); cols.append(xi[hit])
+
+	rows = concatenate(rows+[zeros(0,dtype=int64)])
+	cols = concatenate(cols+[zeros(0,dtype=int64)])
+
+	return rows, cols
+
+def makeSparseRP(rows,cols,shape):
+	"""
+	Builds a sparseRP from (rows, columns) of recurrent points.
+	"""
+
+	order = lexsort( (cols,rows) )
+	indptr = zeros(shape[0]+1,dtype=int64)
+	indptr[1:] = cumsum(bincount(rows,minlength=shape[0]))
+
+	return sparseRP(indptr,cols[order],shape)
+
+def codeRP(codesX,codesY):
+	"""
+	Builds the sparseRP with RP[j,i] = 1 where codesY[j] equals 
+	codesX[i]. X is sorted by code once, then every row is one
+	block of that order, so the cost is O(N log N) plus the
+	no. of recurrences, no distances are computed.
+	"""
+
+	order = argsort(codesX,kind='mergesort')
+	sortedX = codesX[order]
+
+	left = searchsorted(sortedX,codesY,'left')
+	counts = searchsorted(sortedX,codesY,'right') - left
+
+	indptr = zeros(len(codesY)+1,dtype=int64)
+	indptr[1:] = cumsum(counts)
+
+	# the stable sort keeps the columns of a block ascending
+	first = repeat(left - indptr[:-1],counts)
+	indices = order[first + arange(indptr[-1])]
+
+	return sparseRP(indptr,indices,(len(codesY),len(codesX)))
+
+def sparseTiles(Xemb,Yemb,eps,norm='max',tileSize=TILESIZE,theiler=0):
+	"""
+	Computes a sparse (C)RP with the neighbour grid, without
+	the points closer than theiler to the main diagonal.
+	"""
+
+	rows, cols = neighbourPairs(Xemb,Yemb,eps,norm,tileSize,theiler)
+
+	return makeSparseRP(rows,cols,(len(Yemb),len(Xemb)))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Surrogate data for the crpy module. See crpy for details.
+
+	Surrogates are made in batches: a batch is one 2D array 
+	(surrogates x time), so the FFTs of a whole batch are one
+	numpy.fft call along the time axis. Multi-column data
+	(T x channels) gets the same shuffle/phases on every
+	channel, which keeps the cross-correlations.
+
+		'shuffle'	random permutation of the samples
+		'phase'		Fourier phases randomised, same power spectrum
+		'iaaft'		iterative amplitude adjusted FT, same 
+					values and (nearly) the same spectrum
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+
+# no. of IAAFT iterations
+IAAFTITER = 100
+
+# no. of surrogates per batch (and per parallel task)
+SURRBATCH = 16
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def makeSurrogates(X,nSurr,method='iaaft',seed=0):
+	"""
+	Returns nSurr surrogates of X as (nSurr x len(X)) array,
+	(nSurr x T x channels) for multi-column X. Same seed,
+	same surrogates.
+	"""
+
+	rng = random.RandomState(seed)
+
+	# always (surrogates x time x channels) inside
+	X = asarray(X,dtype=float64)
+	X3 = X.reshape(1,len(X),-1)
+
+	if method == 'shuffle':
+		surr = shuffleBatch(rng,X3,nSurr)
+	elif method == 'phase':
+		surr = phaseBatch(rng,X3,nSurr)
+	elif method == 'iaaft':
+		surr = iaaftBatch(rng,X3,nSurr)
+	else:
+		raise ValueError,"Unknown surrogate method: %s" % method
+
+	return surr.reshape( (nSurr,)+X.shape )
+
+def shuffleBatch(rng,X3,nSurr):
+	"""
+	Random permutations of the samples, one per surrogate.
+	"""
+
+	order = argsort(rng.rand(nSurr,X3.shape[1]),axis=1)
+
+	return X3[0][order]
+
+def phaseBatch(rng,X3,nSurr):
+	"""
+	Random phases for all surrogates in one FFT.
+	"""
+
+	nSamples = X3.shape[1]
+	spec = fft.rfft(X3,axis=1)
+
+	phases = exp(2j*pi*rng.rand(nSurr,spec.shape[1],1))
+
+	# mean and (for even lengths) the Nyquist term stay real
+	phases[:,0] = 1
+	if nSamples % 2 == 0: phases[:,-1] = 1
+
+	return fft.irfft(spec*phases,nSamples,axis=1)
+
+def iaaftBatch(rng,X3,nSurr):
+	"""
+	IAAFT surrogates (Schreiber & Schmitz 1996), all of a
+	batch iterated at once: alternately impose the amplitudes 
+	of the spectrum and the values of X.
+	"""
+
+	nSamples = X3.shape[1]
+	amplitudes = absolute(fft.rfft(X3,axis=1))
+	values = sort(X3,axis=1)
+
+	surr = shuffleBatch(rng,X3,nSurr)
+	for i in range(IAAFTITER):
+
+		spec = fft.rfft(surr,axis=1)
+		spec *= amplitudes / maximum(absolute(spec),finfo(float64).tiny)
+		surr = fft.irfft(spec,nSamples,axis=1)
+
+		# rank order, the values are those of X again
+		ranks = argsort(argsort(surr,axis=1),axis=1)
+		surr = rankValues(values[0],ranks)
+
+	return surr
+
+def rankValues(values,ranks):
+	"""
+	values[ranks] per channel, values is (T x channels).
+	"""
+
+	return values[ranks,arange(values.shape[1])]
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+	Purpose:
+
+	Sliding window RQA for the crpy module.
+	See crpy for details.
+
+	The RP of the current window is kept in a ring buffer.
+	When the window moves on by one point, only the row and
+	column of the new point are computed, and the line
+	histogrammes are updated at the edges of the window
+	instead of being recounted. One step costs O(window)
+	instead of O(window^2).
+
+	Bookkeeping: every diagonal (and every column) is a
+	sequence of points. Lines fully inside the window are
+	kept in the histogrammes, their lengths stored at their
+	first point. A line cut off by the top of the window
+	("head") or still growing at the bottom ("open") is
+	tracked per diagonal/column and only added when the
+	measures are requested.
+
+	* Copyright (c) 2008, Stefan Schinkel, University of Potsdam
+	* All rights reserved.
+	*
+	* Redistribution and use in source and binary forms, with or without
+	* modification, are permitted provided that the following conditions are met:
+	*     * Redistributions of source code must retain the above copyright
+	*       notice, this list of conditions and the following disclaimer.
+	*     * Redistributions in binary form must reproduce the above copyright
+	*       notice, this list of conditions and the following disclaimer in the
+	*       documentation and/or other materials provided with the distribution.
+	*     * Neither the name of the University of Potsdam nor the
+	*       names of its contributors may be used to endorse or promote products
+	*       derived from this software without specific prior written permission.
+	*
+	* THIS SOFTWARE IS PROVIDED BY Stefan Schinkel ''AS IS'' AND ANY
+	* EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+	* WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+	* DISCLAIMED. IN NO EVENT SHALL Stefan Schinkel BE LIABLE FOR ANY
+	* DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+	* (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+	* LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+	* ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+	* (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+	* SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+	$Log$
+"""
+from numpy import *
+from helper import *
+
+##################################
+##  	Sliding RQA class		##
+##################################
+
+class slidingRQA:
+	"""
+	RQA of the last window embedded points of a (C)RP.
+	Points are added with push(), the measures of the
+	current window are returned by measures().
+
+	Positions along a diagonal k = i-j are counted by
+	min(i,j), so the window [t,t+window) covers the
+	positions [t,t+window-|k|) of every diagonal.
+	"""
+
+	def __init__(self,window,eps,norm='max',theiler=1,lMin=2,vMin=2):
+		"""
+		Allocates the ring buffers for a window of
+		window points.
+		"""
+
+		self.window = w = window
+		self.eps = eps
+		self.norm = norm
+		self.theiler = theiler
+		self.lMin = lMin
+		self.vMin = vMin
+
+		# no. of points pushed so far
+		self.n = 0
+		self.allPoints = 0
+
+		# embedded points and the window RP, index is time % window.
+		# the point buffers are allocated by the first push()
+		self.Xbuf = None
+		self.Ybuf = None
+		self.rp = zeros( (w,w), dtype=bool)
+
+		# length of each closed line inside the window, stored
+		# at its first point
+		self.diagLen = zeros( (w,w), dtype=int32)
+		self.vertLen = zeros( (w,w), dtype=int32)
+
+		# histogrammes of the closed lines inside the window
+		self.diagHist = zeros(w+1,dtype=int64)
+		self.vertHist = zeros(w+1,dtype=int64)
+
+		# per diagonal (index k+w-1) and column (index i % window):
+		# start of the open line at the bottom and end of
+		# the line cut off at the top, -1 if there is none
+		self.diagOpen = -ones(2*w-1,dtype=int64)
+		self.diagHead = -ones(2*w-1,dtype=int64)
+		self.vertOpen = -ones(w,dtype=int64)
+		self.vertHead = -ones(w,dtype=int64)
+
+	def push(self,x,y):
+		"""
+		Adds the next embedded point x of X and y of Y.
+		"""
+
+		w, n = self.window, self.n
+
+		# oldest point drops out first
+		if n >= w: self.drop(n-w)
+
+		if self.Xbuf is None:
+			self.Xbuf = zeros( (w,len(x)), dtype=x.dtype)
+			self.Ybuf = zeros( (w,len(y)), dtype=y.dtype)
+
+		t = int(maximum(0,n+1-w))
+		slot = n % w
+		self.Xbuf[slot] = x
+		self.Ybuf[slot] = y
+
+		times = arange(t,n+1)
+		slots = times % w
+		near = absolute(times-n) < self.theiler
+
+		# new column (Y[j] vs x) and new row (X[i] vs y)
+		col = pairRec(x[newaxis,:],self.Ybuf[slots],self.eps,self.norm)
+		row = pairRec(self.Xbuf[slots],y[newaxis,:],self.eps,self.norm)
+		col[near] = False
+		row[near] = False
+
+		self.rp[slots,slot] = col
+		self.rp[slot,slots] = row
+		self.allPoints += count_nonzero(col) + count_nonzero(row[:-1])
+
+		# diagonals get one new point each: k >= 0 from the column,
+		# k < 0 from the row
+		k = concatenate( (n-times,times[:-1]-n) )
+		self.extend(self.diagOpen,self.diagHead,self.diagHist,self.diagLen,
+			k+w-1,concatenate( (col,row[:-1]) ),concatenate( (times,times[:-1]) ),t,k)
+
+		# old columns get one new point at the bottom
+		self.extend(self.vertOpen,self.vertHead,self.vertHist,self.vertLen,
+			slots[:-1],row[:-1],n,t,None)
+
+		# the new column is a fresh sequence
+		self.newColumn(col,t,slot)
+
+		self.n += 1
+
+	def extend(self,lineOpen,head,hist,lengths,keys,rec,pos,t,k):
+		"""
+		Appends one point to each sequence in keys. Lines that
+		end here are added to hist (and their length stored at
+		their first point) or become head lines if they started
+		before the window at t. k is the diagonal or None for
+		columns.
+		"""
+
+		w = self.window
+		start = lineOpen[keys]
+
+		# lines starting here
+		lineOpen[keys[rec & (start < 0)]] = pos if k is None else pos[rec & (start < 0)]
+
+		# lines ending here
+		ends = ~rec & (start >= 0)
+		if not ends.any(): return
+
+		pos = pos if k is None else pos[ends]
+		keys, start = keys[ends], start[ends]
+		lineOpen[keys] = -1
+
+		inside = start >= t
+		head[keys[~inside]] = pos if k is None else pos[~inside]
+
+		keys, start = keys[inside], start[inside]
+		L = (pos if k is None else pos[inside]) - start
+		hist += bincount(L,minlength=w+1)
+
+		# first point of the lines
+		if k is None:
+			lengths[start % w,keys] = L
+		else:
+			k = k[ends][inside]
+			lengths[(start+maximum(-k,0)) % w,(start+maximum(k,0)) % w] = L
+
+	def newColumn(self,col,t,slot):
+		"""
+		Counts the vertical lines of a newly added column.
+		"""
+
+		w = self.window
+		edges = diff(concatenate( ([0],col.view(int8),[0]) ))
+		starts, ends = flatnonzero(edges == 1), flatnonzero(edges == -1)
+
+		self.vertHead[slot] = -1
+		self.vertOpen[slot] = -1
+
+		# the last line is still open if it reaches the bottom
+		if len(ends) and ends[-1] == len(col):
+			self.vertOpen[slot] = t+starts[-1]
+			starts, ends = starts[:-1], ends[:-1]
+
+		L = ends-starts
+		self.vertHist += bincount(L,minlength=w+1)
+		self.vertLen[(t+starts) % w,slot] = L
+
+	def drop(self,t):
+		"""
+		Moves the top of the window from t to t+1, i.e. removes
+		row and column t.
+		"""
+
+		w = self.window
+		c = t % w
+
+		self.allPoints -= count_nonzero(self.rp[c,:]) + count_nonzero(self.rp[:,c]) \
+			- int(self.rp[c,c])
+
+		# closed vertical lines of column t leave with it
+		L = self.vertLen[:,c]
+		self.vertHist -= bincount(L[L > 0],minlength=w+1)
+		self.vertOpen[c] = -1
+		self.vertHead[c] = -1
+
+		# diagonal lines starting at position t lose their first point,
+		# first points are row t (k >= 0) and column t (k < 0)
+		ks = arange(w)
+		rows = concatenate( (zeros(w,dtype=int64)+c,(t+ks[1:]) % w) )
+		cols = concatenate( ((t+ks) % w,zeros(w-1,dtype=int64)+c) )
+		keys = concatenate( (ks,-ks[1:]) ) + w-1
+		self.cutHead(self.diagHead,self.diagHist,self.diagLen[rows,cols],keys,t)
+
+		# same for the vertical lines starting in row t
+		cols = (t+ks[1:]) % w
+		self.cutHead(self.vertHead,self.vertHist,self.vertLen[c,cols],cols,t)
+
+		# free row and column for the next point
+		for a in (self.rp,self.diagLen,self.vertLen):
+			a[c,:] = 0
+			a[:,c] = 0
+
+	def cutHead(self,head,hist,L,keys,t):
+		"""
+		Lines starting at t (lengths L) are cut off by the top
+		of the window and become head lines. Old head lines
+		that end at t are dropped.
+		"""
+
+		w = self.window
+
+		h = head[keys]
+		head[keys] = where(h > t+1,h,-1)
+
+		cut = L > 0
+		hist -= bincount(L[cut],minlength=w+1)
+		head[keys[cut]] = where(L[cut] > 1,t+L[cut],-1)
+
+	def hists(self):
+		"""
+		Returns the histogrammes of diagonal and vertical lines
+		of the current window and its no. of recurrent points.
+		"""
+
+		w, n = self.window, self.n
+		t = int(maximum(0,n-w))
+
+		# diagonal k ends before position n-|k|
+		k = arange(-(w-1),w)
+		diagHist = self.diagHist + self.partialLines(self.diagOpen,self.diagHead,n-absolute(k),t)
+		vertHist = self.vertHist + self.partialLines(self.vertOpen,self.vertHead,n,t)
+
+		return diagHist, vertHist, self.allPoints
+
+	def partialLines(self,lineOpen,head,end,t):
+		"""
+		Histogramme of the head and open lines of the window
+		starting at t.
+		"""
+
+		w = self.window
+
+		L = concatenate( (head[head > t]-t,
+			(end-maximum(lineOpen,t))[lineOpen >= 0]) )
+
+		return bincount(L,minlength=w+1)
+
+	def measures(self):
+		"""
+		Returns the rqa vector of the current window.
+		"""
+
+		size = int(minimum(self.n,self.window))**2
+		diagHist, vertHist, allPoints = self.hists()
+
+		return rqaMeasures(diagHist,vertHist,allPoints,size,self.lMin,self.vMin)
+
+
+class onlineRQA:
+	"""
+	RQA of the most recent window of a live feed of samples.
+	New samples are passed to append(), which embeds them 
+	with the last (dim-1)*tau samples kept from before and
+	pushes the new points into a slidingRQA, so an update
+	costs O(window) per new point.
+
+	The feed can't be normalised by its own mean and std,
+	give them as mu and sigma if known.
+	"""
+
+	def __init__(self,dim,tau,eps,window,norm='max',theiler=1,lMin=2,vMin=2,
+		mu=0.,sigma=1.):
+		"""
+		Sets up an empty feed, see slidingRQA for the
+		parameters of the RQA.
+		"""
+
+		self.dim = dim
+		self.tau = tau
+		self.mu = mu
+		self.sigma = sigma
+
+		self.engine = slidingRQA(window,eps,norm,theiler,lMin,vMin)
+
+		# last (dim-1)*tau samples of X and Y, None until the first
+		# append(). Ytail is None for RPs
+		self.Xtail = None
+		self.Ytail = None
+
+	def append(self,X,Y=[]):
+		"""
+		Adds the samples X (and Y for CRPs, same length) to the 
+		feed. Returns the rqa (see crqa) of the current window.
+		"""
+
+		X = (asarray(X,dtype=float64)-self.mu)/self.sigma
+
+		if self.Xtail is None:
+			self.Xtail = X[:0]
+			if len(Y) > 0: self.Ytail = X[:0]
+
+		if (len(Y) > 0) != (self.Ytail is not None):
+			raise ValueError,"Pass Y on every append() for CRPs, never for RPs"
+
+		X = concatenate( (self.Xtail,X) )
+		self.Xtail = self.keep(X)
+
+		if self.Ytail is not None:
+			Y = (asarray(Y,dtype=float64)-self.mu)/self.sigma
+			Y = concatenate( (self.Ytail,Y) )
+			if len(Y) != len(X):
+				raise ValueError,"X and Y must be of the same length"
+			self.Ytail = self.keep(Y)
+
+		# nothing to embed yet
+		if len(X) <= (self.dim-1)*self.tau: return self.measures()
+
+		Xemb = embedData(X,self.dim,self.tau)
+		Yemb = Xemb if self.Ytail is None else embedData(Y,self.dim,self.tau)
+
+		for n in range(len(Xemb)):
+			self.engine.push(Xemb[n],Yemb[n])
+
+		return self.measures()
+
+	def keep(self,X):
+		"""
+		The samples still needed for the next embedded point.
+		"""
+
+		if self.dim == 1: return X[:0]
+
+		return X[int(maximum(0,len(X)-(self.dim-1)*self.tau)):].copy()
+
+	def measures(self):
+		"""
+		Returns the rqa vector of the current window, zeros
+		before the first embedded point.
+		"""
+
+		if self.engine.n == 0: return zeros(8)
+
+		return self.engine.measures()
+
+
+##################################
+##  	Helper Functions		##
+##################################
+
+def slidingWindows(Xemb,Yemb,eps,window,step,first,nWindows,norm='max',
+	theiler=1,lMin=2,vMin=2):
+	"""
+	Returns the rqa rows of nWindows windows, starting with
+	window no. first (at embedded point first*step).
+	"""
+
+	rqa = zeros( (nWindows,8) )
+	engine = slidingRQA(window,eps,norm,theiler,lMin,vMin)
+
+	start = first*step
+	for n in range(start,start+window+(nWindows-1)*step):
+
+		engine.push(Xemb[n],Yemb[n])
+
+		m = n+1-window-start
+		if m >= 0 and m % step == 0:
+			rqa[m // step] = engine.measures()
+
+	return rqa